@@ -8,13 +8,28 @@ based on the operating system.
 
 import os
 import sys
+import errno
+import functools
+import hashlib
 import platform
 import subprocess
 import shutil
 from pathlib import Path
-import urllib.request
 import tempfile
-from pydub import AudioSegment
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Optional in-process rendering; without these midi_to_mp3 runs the fluidsynth CLI
+try:
+    import fluidsynth as pyfluidsynth
+    import lameenc
+    import mido
+except ImportError:
+    pyfluidsynth = None
 
 # URLs for SoundFont files
 SOUNDFONT_URLS = [
@@ -22,6 +37,27 @@ SOUNDFONT_URLS = [
     "http://www.schristiancollins.com/soundfonts/FluidR3_GM.sf2",
 ]
 
+# Size of each chunk written to disk while streaming a download
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_TIMEOUT = 30
+# Mirrors that do not answer a HEAD request within this many seconds are skipped
+PROBE_TIMEOUT = 5
+
+SAMPLE_RATE = 44100
+# Audio rendered after the last MIDI event so released notes can decay
+RELEASE_TAIL_FRAMES = SAMPLE_RATE
+# Rendered audio is handed to the encoder in blocks of this many frames,
+# with at most PCM_QUEUE_SIZE blocks waiting to be encoded
+RENDER_BLOCK_FRAMES = 4096
+PCM_QUEUE_SIZE = 8
+
+# A FluidSynth instance is not safe to drive from two threads at once, so each thread that
+# renders gets its own, kept here for the thread's later renders
+_THREAD_SYNTHS = threading.local()
+
+# Keep subprocesses from opening a console window on Windows
+_CREATION_FLAGS = subprocess.CREATE_NO_WINDOW if os.name == "nt" else 0
+
 SOUNDFONT_PATHS = {
     "linux": [
         "/usr/share/sounds/sf2/FluidR3_GM.sf2",
@@ -31,9 +67,9 @@ SOUNDFONT_PATHS = {
         "/usr/local/share/sounds/sf2/FluidR3_GM.sf2",
         "/opt/homebrew/share/sounds/sf2/FluidR3_GM.sf2",
     ],
-"win32": [
+    # The %APPDATA% entry is added by _candidate_soundfont_paths() on Windows only
+    "win32": [
         r"C:\soundfonts\FluidR3_GM.sf2",
-        os.path.join(os.getenv("APPDATA"), "soundfonts", "FluidR3_GM.sf2"),
         r"C:\Users\varun\Downloads\SM2AF\soundfonts\FluidR3_GM.sf2",
     ],
 }
@@ -44,16 +80,72 @@ INSTALL_PATHS = {
     "win32": os.path.join(os.path.expanduser("~"), "soundfonts"),
 }
 
+def _build_session():
+    """Create an HTTP session that retries transient failures with backoff."""
+    retry = Retry(
+        total=5,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=["GET", "HEAD"],
+    )
+    adapter = HTTPAdapter(max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+SESSION = _build_session()
+# Mirror probes must answer within PROBE_TIMEOUT, so they are sent once, without retries
+PROBE_SESSION = requests.Session()
+
+@functools.lru_cache(maxsize=None)
+def _platform_key():
+    """Return the SOUNDFONT_PATHS/INSTALL_PATHS key for this host: linux, darwin or win32."""
+    system = platform.system().lower()
+    if system == "windows":
+        return "win32"
+    if "darwin" in system:
+        return "darwin"
+    return "linux"
+
+@functools.lru_cache(maxsize=1)
+def _candidate_soundfont_paths():
+    """Return the SoundFont locations to search on this host."""
+    paths = list(SOUNDFONT_PATHS[_platform_key()])
+    if _platform_key() == "win32":
+        appdata = os.getenv("APPDATA")
+        if appdata:
+            paths.insert(1, os.path.join(appdata, "soundfonts", "FluidR3_GM.sf2"))
+    return tuple(paths)
+
+@functools.lru_cache(maxsize=1)
+def _fluidsynth_binary():
+    """Return the absolute path of the fluidsynth executable, or None if it is not on PATH."""
+    return shutil.which("fluidsynth")
+
+@functools.lru_cache(maxsize=1)
+def _ffmpeg_binary():
+    """Return the absolute path of the ffmpeg executable, or None if it is not on PATH."""
+    return shutil.which("ffmpeg")
+
+@functools.lru_cache(maxsize=1)
 def check_fluidsynth():
     """Check if FluidSynth is installed."""
+    fluidsynth = _fluidsynth_binary()
+    if fluidsynth is None:
+        print("FluidSynth not found in PATH")
+        print("Ensure FluidSynth is installed and accessible.")
+        print("Current PATH:", os.environ.get("PATH"))
+        return False
+
     try:
         # Use a simple command that doesn't try to load default soundfonts
         process = subprocess.Popen(
-            ["fluidsynth", "-version"],  # Changed to -version instead of -ni -version
+            [fluidsynth, "-version"],  # Changed to -version instead of -ni -version
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
-            creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+            creationflags=_CREATION_FLAGS
         )
         
         stdout, stderr = process.communicate(timeout=10)
@@ -85,19 +177,7 @@ def check_fluidsynth():
 
 def check_existing_soundfont():
     """Check if a SoundFont file already exists."""
-    system = platform.system().lower()
-    if system == "windows":
-        system = "win32"
-    elif system == "darwin" or "darwin" in system:
-        system = "darwin"
-    else:
-        system = "linux"
-
-    if system not in SOUNDFONT_PATHS:
-        print(f"Unsupported system: {system}")
-        return None
-
-    for path in SOUNDFONT_PATHS[system]:
+    for path in _candidate_soundfont_paths():
         if os.path.exists(path):
             print(f"SoundFont found at: {path}")
             return path
@@ -105,21 +185,109 @@ def check_existing_soundfont():
     print("No existing SoundFont found.")
     return None
 
+def _owned_by_us(path):
+    """True if path is not a symlink and belongs to the current user (always true on Windows)."""
+    if os.path.islink(path):
+        return False
+    return not hasattr(os, "getuid") or os.lstat(path).st_uid == os.getuid()
+
+def _partial_download_path(url):
+    """Return a stable file path for url so interrupted downloads can resume.
+
+    The file lives in a private per-user directory rather than the shared temp directory,
+    where another user could plant a file for the installer to move into place.
+    """
+    cache_root = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    download_dir = os.path.join(cache_root, "sm2af")
+    os.makedirs(download_dir, mode=0o700, exist_ok=True)
+    if not _owned_by_us(download_dir):
+        raise PermissionError(f"{download_dir} is not a directory owned by the current user")
+    digest = hashlib.sha256(url.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(download_dir, f"soundfont_{digest}.sf2")
+
+def _probe_mirror(url):
+    """Send a HEAD request to url and return the response if it succeeded."""
+    response = PROBE_SESSION.head(url, allow_redirects=True, timeout=PROBE_TIMEOUT)
+    response.raise_for_status()
+    return response
+
+def _healthy_mirrors():
+    """Probe all SOUNDFONT_URLS concurrently and yield (url, head) for usable ones, fastest first."""
+    with ThreadPoolExecutor(max_workers=len(SOUNDFONT_URLS)) as executor:
+        futures = {executor.submit(_probe_mirror, url): url for url in SOUNDFONT_URLS}
+        for future in as_completed(futures):
+            url = futures[future]
+            try:
+                head = future.result()
+            except Exception as e:
+                print(f"Mirror unavailable: {url} ({e})")
+                continue
+            if int(head.headers.get("Content-Length", 0)) > 100000:  # Larger than 100KB
+                yield url, head
+            else:
+                print(f"Mirror {url} does not report a plausible SoundFont size, skipping.")
+
+def _stream_download(url, head=None):
+    """Stream url to disk in chunks, resuming a partial download when possible."""
+    tmp_path = _partial_download_path(url)
+
+    if head is None:
+        head = _probe_mirror(url)
+    total = int(head.headers.get("Content-Length", 0))
+    accepts_ranges = head.headers.get("Accept-Ranges", "").lower() == "bytes"
+
+    existing = 0
+    if os.path.lexists(tmp_path):
+        if _owned_by_us(tmp_path):
+            existing = os.path.getsize(tmp_path)
+        else:
+            print(f"Discarding {tmp_path}: not a regular file owned by the current user")
+            os.unlink(tmp_path)
+    if total and existing == total:
+        print(f"Reusing complete download at {tmp_path}")
+        return tmp_path
+
+    headers = {}
+    if 0 < existing < total and accepts_ranges:
+        print(f"Resuming download at byte {existing} of {total}")
+        headers["Range"] = f"bytes={existing}-"
+
+    with SESSION.get(url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT) as response:
+        response.raise_for_status()
+        # Only append when the server actually honoured the Range request
+        mode = "ab" if response.status_code == 206 else "wb"
+        with open(tmp_path, mode) as f:
+            for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+
+    size = os.path.getsize(tmp_path)
+    if total and size < total:
+        raise IOError(f"Incomplete download: got {size} of {total} bytes")
+    return tmp_path
+
+def _validate_soundfont(path):
+    """Return None if path is a SoundFont 2 file, else the reason it is not."""
+    with open(path, "rb") as f:
+        header = f.read(12)
+    if header[0:4] != b"RIFF" or header[8:12] != b"sfbk":
+        return "not a SoundFont 2 file (missing RIFF/sfbk header)"
+    return None
+
 def download_soundfont():
-    """Download a SoundFont file."""
-    for url in SOUNDFONT_URLS:
+    """Download a SoundFont file from the first mirror that responds."""
+    for url, head in _healthy_mirrors():
         print(f"Trying to download SoundFont from: {url}")
         try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".sf2") as tmp_file:
-                urllib.request.urlretrieve(url, tmp_file.name)
-                if os.path.getsize(tmp_file.name) > 100000:  # Larger than 100KB
-                    print(f"Successfully downloaded SoundFont to {tmp_file.name}")
-                    return tmp_file.name
-                else:
-                    print(f"Downloaded file from {url} is too small, might be invalid.")
-                    os.unlink(tmp_file.name)
-        except urllib.error.HTTPError as e:
-            print(f"HTTP Error downloading from {url}: {e.code} {e.reason}")
+            tmp_path = _stream_download(url, head)
+            problem = _validate_soundfont(tmp_path)
+            if problem is None:
+                print(f"Successfully downloaded SoundFont to {tmp_path}")
+                return tmp_path
+            else:
+                print(f"Downloaded file from {url} is invalid: {problem}")
+                os.unlink(tmp_path)
+        except requests.HTTPError as e:
+            print(f"HTTP Error downloading from {url}: {e.response.status_code} {e.response.reason}")
         except Exception as e:
             print(f"Error downloading from {url}: {str(e)}")
 
@@ -129,55 +297,61 @@ def download_soundfont():
             print(f"  - {path}")
     return None
 
-def install_soundfont(sf_file):
-    """Install the SoundFont file to the appropriate location."""
-    system = platform.system().lower()
-    if system == "windows":
-        system = "win32"
-    elif system == "darwin" or "darwin" in system:
-        system = "darwin"
-    else:
-        system = "linux"
+def _move_file(src, dst):
+    """Move src to dst with a rename, copying only when they are on different devices."""
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        shutil.copy2(src, dst)
+        os.unlink(src)
 
-    if system not in INSTALL_PATHS:
-        print(f"Unsupported system: {system}")
+def _dir_writable(path):
+    """Return True if a file can be created in path, creating the directory if needed."""
+    try:
+        os.makedirs(path, exist_ok=True)
+        fd, canary = tempfile.mkstemp(dir=path)
+    except OSError:
         return False
+    os.close(fd)
+    os.unlink(canary)
+    return True
 
+def install_soundfont(sf_file):
+    """Install the SoundFont file to the appropriate location."""
     local_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "soundfonts")
-    
-    try:
-        system_dir = INSTALL_PATHS[system]
-        os.makedirs(system_dir, exist_ok=True)
-        system_path = os.path.join(system_dir, "FluidR3_GM.sf2")
-        shutil.copy(sf_file, system_path)
-        print(f"SoundFont installed to: {system_path}")
-        return True
-    except (PermissionError, OSError) as e:
-        print(f"Could not install to system directory: {e}")
+    system_dir = INSTALL_PATHS[_platform_key()]
+
+    # Check with an empty canary file first so an unprivileged install goes
+    # straight to the project directory instead of failing halfway through
+    if _dir_writable(system_dir):
         try:
-            os.makedirs(local_dir, exist_ok=True)
-            local_path = os.path.join(local_dir, "FluidR3_GM.sf2")
-            shutil.copy(sf_file, local_path)
-            print(f"SoundFont installed to project directory: {local_path}")
+            system_path = os.path.join(system_dir, "FluidR3_GM.sf2")
+            _move_file(sf_file, system_path)
+            print(f"SoundFont installed to: {system_path}")
+            _locate_soundfont.cache_clear()
             return True
-        except Exception as e:
-            print(f"Could not install to local directory: {e}")
-            return False
-
-def get_soundfont_path():
-    """Dynamically locate the SoundFont file."""
-    system = platform.system().lower()
-    if system == "windows":
-        system = "win32"
-    elif system == "darwin":
-        system = "darwin"
+        except (PermissionError, OSError) as e:
+            print(f"Could not install to system directory: {e}")
     else:
-        system = "linux"
+        print(f"System directory is not writable: {system_dir}")
 
-    if system not in SOUNDFONT_PATHS:
-        raise ValueError(f"Unsupported system: {system}")
+    try:
+        os.makedirs(local_dir, exist_ok=True)
+        local_path = os.path.join(local_dir, "FluidR3_GM.sf2")
+        _move_file(sf_file, local_path)
+        print(f"SoundFont installed to project directory: {local_path}")
+        _locate_soundfont.cache_clear()
+        return True
+    except Exception as e:
+        print(f"Could not install to local directory: {e}")
+        return False
 
-    for path in SOUNDFONT_PATHS[system]:
+@functools.lru_cache(maxsize=1)
+def _locate_soundfont():
+    """Search the candidate locations once per process; misses are not cached."""
+    for path in _candidate_soundfont_paths():
         print(f"Checking SoundFont at: {path}")
         if os.path.exists(path):
             path = path.replace('\\', '/')  # Convert backslashes to forward slashes
@@ -194,30 +368,212 @@ def get_soundfont_path():
 
     raise FileNotFoundError("SoundFont not found. Please run the installation script or place FluidR3_GM.sf2 manually.")
 
+def get_soundfont_path():
+    """Dynamically locate the SoundFont file."""
+    return _locate_soundfont()
+
 
-def midi_to_mp3(midi_path, mp3_path):
-    """Convert MIDI to MP3 using only FluidSynth subprocess and pydub."""
+def _resident_synth(soundfont_path):
+    """Return this thread's FluidSynth instance with the SoundFont loaded, creating it on first use.
+
+    Renders on different threads run in parallel, each with its own synth and its own copy
+    of the SoundFont in memory.
+    """
+    synths = getattr(_THREAD_SYNTHS, "synths", None)
+    if synths is None:
+        synths = _THREAD_SYNTHS.synths = {}
+    if soundfont_path not in synths:
+        synth = pyfluidsynth.Synth(gain=0.5, samplerate=float(SAMPLE_RATE))
+        synths[soundfont_path] = (synth, synth.sfload(soundfont_path))
+    return synths[soundfont_path]
+
+def _reset_synth(synth, sfid):
+    """Silence the synth and restore default programs left over from a previous render."""
+    for channel in range(16):
+        synth.cc(channel, 120, 0)  # All sound off
+        synth.cc(channel, 121, 0)  # Reset all controllers
+        synth.program_select(channel, sfid, 128 if channel == 9 else 0, 0)  # Channel 10 is drums
+
+def _render_frames(synth, frames):
+    """Yield frames of synth output as 16-bit stereo PCM, RENDER_BLOCK_FRAMES at a time."""
+    while frames > 0:
+        block = min(frames, RENDER_BLOCK_FRAMES)
+        yield pyfluidsynth.raw_audio_string(synth.get_samples(block))
+        frames -= block
+
+def _render_pcm(synth, midi_file):
+    """Yield 16-bit stereo PCM for a mido.MidiFile, rendering the audio between consecutive MIDI events."""
+    elapsed = 0.0
+    rendered = 0
+    for message in midi_file:
+        # Iterating a MidiFile gives delta times in seconds with tempo changes applied
+        elapsed += message.time
+        frames = int(elapsed * SAMPLE_RATE) - rendered
+        if frames > 0:
+            yield from _render_frames(synth, frames)
+            rendered += frames
+
+        if message.type == "note_on":
+            synth.noteon(message.channel, message.note, message.velocity)
+        elif message.type == "note_off":
+            synth.noteoff(message.channel, message.note)
+        elif message.type == "control_change":
+            synth.cc(message.channel, message.control, message.value)
+        elif message.type == "program_change":
+            synth.program_change(message.channel, message.program)
+        elif message.type == "pitchwheel":
+            synth.pitch_bend(message.channel, message.pitch)
+
+    # Let the final notes ring out
+    yield from _render_frames(synth, RELEASE_TAIL_FRAMES)
+
+def _render_into_queue(synth, midi_file, pcm_queue, stop):
+    """Render on a worker thread, ending with None or the exception that stopped rendering."""
     try:
-        soundfont_path = get_soundfont_path()
-        print(f"Using SoundFont at: {soundfont_path}")
-        
-        # Create WAV file path
-        wav_path = midi_path.replace('.mid', '.wav')
-        
+        for pcm in _render_pcm(synth, midi_file):
+            if stop.is_set():
+                break
+            pcm_queue.put(pcm)
+    except Exception as e:
+        pcm_queue.put(e)
+        return
+    pcm_queue.put(None)
+
+def _mp3_frames(soundfont_path, midi_file):
+    """Render a mido.MidiFile with the resident synth and yield it as MP3 data, encoded with lameenc.
+
+    Uses the synth of the thread that starts iterating, so iterate on that one thread only.
+    """
+    encoder = lameenc.Encoder()
+    encoder.set_bit_rate(128)
+    encoder.set_in_sample_rate(SAMPLE_RATE)
+    encoder.set_channels(2)
+    encoder.set_quality(2)
+
+    synth, sfid = _resident_synth(soundfont_path)
+    _reset_synth(synth, sfid)
+
+    # Synthesis and encoding overlap: the renderer thread fills a bounded queue
+    # while this thread encodes, so neither waits on the other for the whole file
+    pcm_queue = queue.Queue(maxsize=PCM_QUEUE_SIZE)
+    stop = threading.Event()
+    renderer = threading.Thread(target=_render_into_queue, args=(synth, midi_file, pcm_queue, stop), daemon=True)
+    renderer.start()
+    try:
+        while (pcm := pcm_queue.get()) is not None:
+            if isinstance(pcm, Exception):
+                raise pcm
+            yield encoder.encode(pcm)
+        yield encoder.flush()
+    finally:
+        # Never reuse the synth while the renderer may still be using it
+        stop.set()
+        while renderer.is_alive():
+            try:
+                pcm_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        renderer.join()
+
+def _synth_midi_to_mp3(soundfont_path, midi_path, mp3_path):
+    """Render MIDI with the resident synth and encode it to MP3 with lameenc, all in-process."""
+    print(f"Rendering {midi_path} with the resident FluidSynth instance...")
+    with open(mp3_path, "wb") as f:
+        for mp3_data in _mp3_frames(soundfont_path, mido.MidiFile(midi_path)):
+            f.write(mp3_data)
+
+
+def _pipe_midi_to_mp3(soundfont_path, midi_path, mp3_path):
+    """Render MIDI as raw PCM on FluidSynth's stdout and encode it with ffmpeg."""
+    # A fresh FluidSynth process is started per render on purpose: file rendering is
+    # only available through the -F command line mode, the interactive shell (-s or
+    # stdin) can load fonts and drive the player but has no command to render to a
+    # file, so a resident CLI process cannot reuse its loaded SoundFont here.
+    fluidsynth_cmd = [
+        _fluidsynth_binary(),
+        "-ni",  # No interactive mode
+        "-q",  # Keep informational output off stdout
+        "-g", "0.5",  # Gain
+        "-T", "raw",  # Headerless PCM
+        "-O", "s16",  # 16-bit samples
+        "-r", "44100",  # Sample rate
+        "-F", "-",  # Render to stdout
+        soundfont_path,  # SoundFont file
+        midi_path  # Input MIDI file
+    ]
+    ffmpeg_cmd = [
+        _ffmpeg_binary(),
+        "-y",
+        "-loglevel", "error",
+        "-f", "s16le", "-ar", "44100", "-ac", "2",  # Matches the FluidSynth output above
+        "-i", "-",
+        "-codec:a", "libmp3lame",
+        mp3_path
+    ]
+
+    print(f"Running FluidSynth command: {' '.join(fluidsynth_cmd)}")
+    print(f"Piping into ffmpeg command: {' '.join(ffmpeg_cmd)}")
+
+    with tempfile.TemporaryFile() as fluidsynth_stderr:
+        fluidsynth = subprocess.Popen(
+            fluidsynth_cmd,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=fluidsynth_stderr,
+            creationflags=_CREATION_FLAGS
+        )
+        ffmpeg = subprocess.Popen(
+            ffmpeg_cmd,
+            stdin=fluidsynth.stdout,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            creationflags=_CREATION_FLAGS
+        )
+        # Only ffmpeg should hold the read end, so FluidSynth gets SIGPIPE if ffmpeg exits early
+        fluidsynth.stdout.close()
+
+        try:
+            _, ffmpeg_err = ffmpeg.communicate(timeout=60)
+            fluidsynth.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            print("FluidSynth/ffmpeg pipeline timed out, terminating...")
+            for process in (fluidsynth, ffmpeg):
+                process.kill()
+                process.wait()
+            raise Exception("FluidSynth conversion timed out")
+
+        if fluidsynth.returncode != 0:
+            fluidsynth_stderr.seek(0)
+            print(f"FluidSynth stderr: {fluidsynth_stderr.read().decode(errors='replace')}")
+            raise Exception(f"FluidSynth failed with return code {fluidsynth.returncode}")
+
+    if ffmpeg.returncode != 0:
+        print(f"ffmpeg stderr: {ffmpeg_err.decode(errors='replace')}")
+        raise Exception(f"ffmpeg failed with return code {ffmpeg.returncode}")
+
+
+def _wav_midi_to_mp3(soundfont_path, midi_path, mp3_path):
+    """Render MIDI to a temporary WAV with FluidSynth and convert it with pydub."""
+    from pydub import AudioSegment
+
+    # Each conversion renders into its own directory, removed on exit even on failure
+    with tempfile.TemporaryDirectory() as temp_dir:
+        wav_path = str(Path(temp_dir) / "render.wav")
+
         # Use direct FluidSynth subprocess call - skip midi2audio entirely
         print("Converting MIDI to WAV using direct FluidSynth command...")
-        
+
         fluidsynth_cmd = [
-            "fluidsynth",
+            _fluidsynth_binary(),
             "-ni",  # No interactive mode
             "-g", "0.5",  # Gain
             "-F", wav_path,  # Output WAV file
             soundfont_path,  # SoundFont file
             midi_path  # Input MIDI file
         ]
-        
+
         print(f"Running FluidSynth command: {' '.join(fluidsynth_cmd)}")
-        
+
         # Use Popen to better control the process
         process = subprocess.Popen(
             fluidsynth_cmd,
@@ -225,9 +581,9 @@ def midi_to_mp3(midi_path, mp3_path):
             stderr=subprocess.PIPE,
             stdin=subprocess.PIPE,
             text=True,
-            creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
+            creationflags=_CREATION_FLAGS
         )
-        
+
         # Send quit command and wait for completion
         try:
             stdout, stderr = process.communicate(input="quit\n", timeout=60)
@@ -239,23 +595,23 @@ def midi_to_mp3(midi_path, mp3_path):
             except subprocess.TimeoutExpired:
                 process.kill()
             raise Exception("FluidSynth conversion timed out")
-        
+
         # Check result
         if process.returncode not in [0, -15]:  # 0 = success, -15 = SIGTERM (normal when we send quit)
             print(f"FluidSynth stderr: {stderr}")
             print(f"FluidSynth stdout: {stdout}")
             if not os.path.exists(wav_path) or os.path.getsize(wav_path) == 0:
                 raise Exception(f"FluidSynth failed with return code {process.returncode}")
-        
+
         # Check if WAV file was created and has content
         if not os.path.exists(wav_path):
             raise Exception(f"WAV file was not created: {wav_path}")
-            
+
         if os.path.getsize(wav_path) == 0:
             raise Exception(f"WAV file is empty: {wav_path}")
-            
+
         print(f"WAV file created successfully: {wav_path} ({os.path.getsize(wav_path)} bytes)")
-        
+
         # Convert WAV to MP3 using pydub
         print(f"Converting WAV to MP3: {wav_path} -> {mp3_path}")
         try:
@@ -264,14 +620,24 @@ def midi_to_mp3(midi_path, mp3_path):
             print(f"Successfully converted WAV to MP3: {mp3_path}")
         except Exception as e:
             raise Exception(f"WAV to MP3 conversion failed: {str(e)}")
+
+
+def midi_to_mp3(midi_path, mp3_path):
+    """Convert MIDI to MP3 with the in-process synth, else by piping FluidSynth into ffmpeg,
+    else via WAV and pydub."""
+    try:
+        soundfont_path = get_soundfont_path()
+        print(f"Using SoundFont at: {soundfont_path}")
         
-        # Clean up WAV file
-        try:
-            if os.path.exists(wav_path):
-                os.remove(wav_path)
-                print(f"Cleaned up temporary WAV file: {wav_path}")
-        except Exception as e:
-            print(f"Warning: Could not remove temporary WAV file {wav_path}: {e}")
+        if pyfluidsynth is not None:
+            _synth_midi_to_mp3(soundfont_path, midi_path, mp3_path)
+        elif _fluidsynth_binary() is None:
+            raise FileNotFoundError("FluidSynth not found in PATH")
+        elif _ffmpeg_binary() is None:
+            print("ffmpeg not found, converting through an intermediate WAV file...")
+            _wav_midi_to_mp3(soundfont_path, midi_path, mp3_path)
+        else:
+            _pipe_midi_to_mp3(soundfont_path, midi_path, mp3_path)
         
         # Verify MP3 file was created
         if not os.path.exists(mp3_path):
@@ -283,17 +649,22 @@ def midi_to_mp3(midi_path, mp3_path):
         print(f"MP3 conversion completed successfully: {mp3_path} ({os.path.getsize(mp3_path)} bytes)")
         
     except Exception as e:
-        # Clean up any temporary files on error
-        wav_path = midi_path.replace('.mid', '.wav')
-        for temp_file in [wav_path]:
-            try:
-                if os.path.exists(temp_file):
-                    os.remove(temp_file)
-            except:
-                pass
         raise Exception(f"MIDI to MP3 conversion failed: {str(e)}")
 
 
+def midi_to_mp3_stream(midi_path):
+    """Return an iterator of MP3 data for midi_path, produced while the MIDI is still rendering.
+
+    Returns None when in-process rendering (pyfluidsynth, lameenc, mido) is unavailable;
+    use midi_to_mp3 then. The MIDI file is read before returning, so it may be deleted
+    while the iterator is still being consumed.
+    """
+    if pyfluidsynth is None:
+        return None
+    soundfont_path = get_soundfont_path()
+    print(f"Streaming {midi_path} as MP3 with the resident FluidSynth instance...")
+    return _mp3_frames(soundfont_path, mido.MidiFile(midi_path))
+
 def test_midi_conversion():
     """Test function to verify MIDI to MP3 conversion works."""
     # This is a simple test function you can call to verify the conversion works
@@ -340,7 +711,9 @@ def main():
     print("\nInstalling SoundFont...")
     success = install_soundfont(downloaded_sf)
     
-    os.unlink(downloaded_sf)
+    # install_soundfont moves the file, so this only cleans up after a failure
+    if os.path.exists(downloaded_sf):
+        os.unlink(downloaded_sf)
     
     if success:
         print("\nSoundFont installation complete!")
@@ -1,17 +1,77 @@
+import asyncio
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+import contextlib
+import hashlib
 import logging
+import mmap
 import os
+import shutil
+import tempfile
+import threading
+import time
 import uuid
+import aiofiles
+import aiofiles.os
 from fastapi import FastAPI, File, UploadFile, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
-from src.prototype import preprocess_image, process_sheet_music_image, convert_musicxml_to_midi
-from install_soundfont import midi_to_mp3, get_soundfont_path
+from starlette.datastructures import Headers
+from fastapi.responses import FileResponse, ORJSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
+from src.omr_core import MAX_OMR_WORKERS, preprocess_image, process_sheet_music_image, convert_musicxml_to_midi, warm_up
+from src.util import TMP_DIR, cleanup_files, remove_files
+from install_soundfont import midi_to_mp3, midi_to_mp3_stream, get_soundfont_path
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
+
+# Largest request body accepted; bigger uploads are rejected with 413
+MAX_UPLOAD_BYTES = 50 * 1024 * 1024
+
+
+class BodySizeLimitMiddleware:
+    """Reject request bodies over max_bytes with 413.
+
+    A declared Content-Length is checked before anything is read. Otherwise (e.g. chunked
+    uploads) the body is counted as it arrives, so it is cut off before FastAPI has spooled
+    more than max_bytes of it. Plain ASGI rather than @app.middleware, which cannot see
+    the body as it is received.
+    """
+
+    def __init__(self, app, max_bytes):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        content_length = Headers(scope=scope).get("content-length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_bytes:
+            response = ORJSONResponse(status_code=413, content={"detail": "Request body is too large"})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # FastAPI re-raises HTTPExceptions from body parsing, so this becomes a 413
+                    raise HTTPException(status_code=413, detail="Request body is too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+# Registered before CORSMiddleware so CORS wraps it: browsers can then read the 413
+app.add_middleware(BodySizeLimitMiddleware, max_bytes=MAX_UPLOAD_BYTES)
 
 # Allow CORS
 app.add_middleware(
@@ -22,9 +82,377 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Define upload folder
-UPLOAD_FOLDER = "uploads"
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Finished MP3s keyed by a hash of the uploaded image, so repeat uploads skip the pipeline.
+# Once the cache holds more than MP3_CACHE_MAX_BYTES, the least recently used MP3s are removed.
+# Set MP3_CACHE_DIR to keep the cache across restarts (compose.yaml mounts a volume there);
+# the app directory itself may not be writable by the server's user.
+MP3_CACHE_FOLDER = os.environ.get("MP3_CACHE_DIR", os.path.join(tempfile.gettempdir(), "sm2af-cache"))
+MP3_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
+# Uploads are copied to disk in chunks of this size rather than read whole
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+# The pipeline stages are blocking, so they run in executors instead of on the event loop.
+# Each stage is awaited on its own pool, so one request's MP3 encode overlaps the next
+# request's OMR: CPU-bound OMR and MusicXML parsing use processes, while preprocessing
+# (OpenCV) and MP3 rendering (FluidSynth) release the GIL and use threads.
+# Workers run warm_up as their initializer, so OMR models are loaded before a worker
+# takes its first request even where workers are spawned rather than forked. Each worker
+# runs a multi-threaded OMR model, so there are only MAX_OMR_WORKERS (OMR_WORKERS) of them.
+PROCESS_WORKERS = MAX_OMR_WORKERS
+EXECUTOR = concurrent.futures.ProcessPoolExecutor(max_workers=PROCESS_WORKERS, initializer=warm_up)
+IO_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count())
+# MP3 rendering gets its own threads, so long renders never tie up the threads preprocessing
+# depends on. Each render thread keeps its own synth with its own copy of the SoundFont
+# (over 100 MB for FluidR3), so RENDER_WORKERS renders overlap at the cost of that much memory each.
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", 2))
+RENDER_EXECUTOR = concurrent.futures.ThreadPoolExecutor(max_workers=RENDER_WORKERS)
+# Streamed responses render only while holding one of STREAM_SLOTS, so at most one stream
+# per render thread is in flight, each with at most STREAM_QUEUE_CHUNKS chunks buffered
+STREAM_SLOTS = asyncio.Semaphore(RENDER_WORKERS)
+STREAM_QUEUE_CHUNKS = 16
+
+# Each in-flight request works in one of these fixed directories instead of generating
+# fresh file names. A request waits for a free slot, which also caps how many requests run
+# the pipeline at once. The slots live in a fresh directory per server process, so workers
+# sharing TMP_DIR, or files left by an earlier run, can never be mistaken for a request's output.
+SLOT_COUNT = 64
+SLOT_ROOT = None  # Created on startup with tempfile.mkdtemp
+SLOT_POOL = None  # asyncio.Queue of slot names, created on startup inside the server's loop
+
+# Background jobs submitted through /jobs, keyed by job id. Finished jobs whose result is
+# not fetched within JOB_TTL_SECONDS are dropped, with their MP3, by a sweep run every
+# JOB_SWEEP_INTERVAL seconds.
+JOBS = {}
+JOB_TTL_SECONDS = 60 * 60
+JOB_SWEEP_INTERVAL = 5 * 60
+
+
+class PipelineError(Exception):
+    """Raised by a pipeline stage with a message suitable for an HTTP 500 detail."""
+
+
+def _request_paths(slot):
+    """Return the upload, MusicXML, MIDI and MP3 paths used by a request holding slot."""
+    slot_dir = os.path.join(SLOT_ROOT, slot)
+    return (
+        os.path.join(slot_dir, "image.png"),
+        os.path.join(slot_dir, "output.musicxml"),
+        os.path.join(slot_dir, "output.mid"),
+        os.path.join(slot_dir, "output.mp3"),
+    )
+
+
+async def _release_slot(slot):
+    """Empty slot and return it to SLOT_POOL, so stale outputs never leak into the next request."""
+    paths = _request_paths(slot)
+    # preprocess_image writes its output next to the upload
+    preprocessed_path = f"{os.path.splitext(paths[0])[0]}_preprocessed.png"
+    await remove_files([*paths, preprocessed_path])
+    SLOT_POOL.put_nowait(slot)
+
+
+@contextlib.asynccontextmanager
+async def _slot():
+    """Hold a slot from SLOT_POOL for the duration of the block."""
+    slot = await SLOT_POOL.get()
+    try:
+        yield slot
+    finally:
+        await _release_slot(slot)
+
+
+async def _save_upload(image, path):
+    """Stream an uploaded file to path without holding the whole body in memory.
+
+    Returns a BLAKE2b hex digest of the contents, computed as the chunks are written.
+    Raises a 413 HTTPException once more than MAX_UPLOAD_BYTES have been read. The request
+    body as a whole is capped by BodySizeLimitMiddleware before FastAPI spools it; this only
+    limits the copy of the one file.
+    """
+    hasher = hashlib.blake2b()
+    size = 0
+    async with aiofiles.open(path, "wb") as buffer:
+        while chunk := await image.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > MAX_UPLOAD_BYTES:
+                raise HTTPException(status_code=413, detail="Uploaded file is too large")
+            hasher.update(chunk)
+            await buffer.write(chunk)
+    return hasher.hexdigest()
+
+
+def _preprocess_stage(temp_image_path):
+    """Step 2: preprocess the upload and return the image path OMR should read."""
+    logger.info("Preprocessing image...")
+    preprocessed_path = preprocess_image(temp_image_path)
+    logger.info("Preprocessing completed: %s", preprocessed_path or temp_image_path)
+    return preprocessed_path
+
+
+def _omr_stage(image_path, output_xml_path):
+    """Step 3: process the sheet music image to generate MusicXML."""
+    logger.info("Processing sheet music image to generate MusicXML...")
+    try:
+        process_sheet_music_image(image_path, output_xml_path)
+    except Exception as e:
+        logger.error("MusicXML generation failed: %s", e)
+        raise PipelineError(f"Failed to process sheet music image: {str(e)}")
+
+    if not os.path.exists(output_xml_path):
+        logger.error("MusicXML output file not found")
+        raise PipelineError(f"Failed to generate MusicXML - {output_xml_path} not found")
+
+
+def _midi_stage(output_xml_path, output_midi_path):
+    """Step 4: convert MusicXML to MIDI."""
+    logger.info("Converting MusicXML to MIDI...")
+    try:
+        convert_musicxml_to_midi(output_xml_path, output_midi_path)
+    except Exception as e:
+        logger.error("MIDI conversion failed: %s", e)
+        raise PipelineError(f"Failed to convert MusicXML to MIDI: {str(e)}")
+    if not os.path.exists(output_midi_path):
+        logger.error("MIDI output file not created")
+        raise PipelineError("Failed to generate MIDI - output file not created")
+    logger.info("MIDI conversion successful")
+
+
+def _mp3_stage(output_midi_path, output_mp3_path):
+    """Step 5: convert MIDI to MP3."""
+    logger.info("Converting MIDI to MP3...")
+    try:
+        # Check SoundFont before conversion
+        soundfont_path = get_soundfont_path()
+        logger.info("Using SoundFont: %s", soundfont_path)
+        
+        if not os.path.exists(soundfont_path):
+            raise FileNotFoundError(f"SoundFont not found at: {soundfont_path}")
+        
+        # Perform conversion
+        midi_to_mp3(output_midi_path, output_mp3_path)
+        
+    except FileNotFoundError as e:
+        logger.error("SoundFont not found: %s", e)
+        raise PipelineError(f"SoundFont not found during MP3 conversion: {str(e)}")
+    except Exception as e:
+        logger.error("MP3 conversion failed: %s", e)
+        raise PipelineError(f"Failed to convert MIDI to MP3: {str(e)}")
+    
+    if not os.path.exists(output_mp3_path):
+        logger.error("MP3 output file not created")
+        raise PipelineError("Failed to generate MP3 - output file not created")
+    
+    logger.info("MP3 conversion successful")
+
+
+def _mp3_stream_stage(output_midi_path):
+    """Step 5, streamed: return an iterator of MP3 data, or None if only midi_to_mp3 can render."""
+    logger.info("Streaming MIDI as MP3...")
+    try:
+        return midi_to_mp3_stream(output_midi_path)
+    except FileNotFoundError as e:
+        logger.error("SoundFont not found: %s", e)
+        raise PipelineError(f"SoundFont not found during MP3 conversion: {str(e)}")
+    except Exception as e:
+        logger.error("MP3 conversion failed: %s", e)
+        raise PipelineError(f"Failed to convert MIDI to MP3: {str(e)}")
+
+
+async def _run_in_process(fn, *args):
+    """Run fn(*args) in EXECUTOR, starting a new pool if a worker has died.
+
+    A worker killed mid-task (e.g. by the OOM killer) breaks the whole pool; the request
+    that hit it fails, but later ones get the new pool instead of failing until restart.
+    """
+    global EXECUTOR
+    executor = EXECUTOR
+    try:
+        return await asyncio.get_running_loop().run_in_executor(executor, fn, *args)
+    except BrokenProcessPool:
+        if EXECUTOR is executor:  # Only the first request to notice replaces it
+            logger.error("An OMR worker died; starting a new process pool")
+            EXECUTOR = concurrent.futures.ProcessPoolExecutor(max_workers=PROCESS_WORKERS, initializer=warm_up)
+            executor.shutdown(wait=False, cancel_futures=True)
+        raise
+
+
+async def _run_to_midi(temp_image_path, output_xml_path, output_midi_path):
+    """Turn an uploaded image into MIDI, running each stage on its executor."""
+    loop = asyncio.get_running_loop()
+    preprocessed_path = await loop.run_in_executor(IO_EXECUTOR, _preprocess_stage, temp_image_path)
+    try:
+        await _run_in_process(_omr_stage, preprocessed_path or temp_image_path, output_xml_path)
+    finally:
+        await remove_files([preprocessed_path])
+    await _run_in_process(_midi_stage, output_xml_path, output_midi_path)
+
+
+async def _run_pipeline(temp_image_path, output_xml_path, output_midi_path, output_mp3_path):
+    """Turn an uploaded image into an MP3, running each stage on its executor."""
+    await _run_to_midi(temp_image_path, output_xml_path, output_midi_path)
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(RENDER_EXECUTOR, _mp3_stage, output_midi_path, output_mp3_path)
+
+
+def _encode_to_cache(mp3_frames, cached_mp3_path, loop, chunk_queue, stop):
+    """Drain mp3_frames into the cache, handing each chunk to chunk_queue on loop and ending it
+    with None, or with the exception that stopped encoding. Gives up once stop is set.
+
+    Runs as one RENDER_EXECUTOR task for the whole stream: mp3_frames holds the synth between
+    chunks, so its steps must never be spread over several tasks. chunk_queue is bounded, so a
+    slow client slows the render down instead of having the whole MP3 buffered in memory.
+    """
+    def hand_over(item):
+        asyncio.run_coroutine_threadsafe(chunk_queue.put(item), loop).result()
+
+    part_path = f"{cached_mp3_path}.{uuid.uuid4().hex}.part"
+    try:
+        with open(part_path, "wb") as cache_file:
+            for chunk in mp3_frames:
+                if stop.is_set():
+                    return  # The client has gone; the partial file is discarded
+                cache_file.write(chunk)
+                hand_over(chunk)
+        os.replace(part_path, cached_mp3_path)
+        _prune_mp3_cache()
+    except Exception as e:
+        logger.error("Streamed MP3 conversion failed: %s", e)
+        if not stop.is_set():
+            hand_over(e)
+    else:
+        if not stop.is_set():
+            hand_over(None)
+    finally:
+        mp3_frames.close()  # Frees the synth straight away if encoding stopped early
+        cleanup_files([part_path])
+
+
+def _store_in_cache(mp3_path, cached_mp3_path):
+    """Move mp3_path to cached_mp3_path so that the cache entry only ever holds a complete file."""
+    part_path = f"{cached_mp3_path}.{uuid.uuid4().hex}.part"
+    try:
+        # TMP_DIR may be on another filesystem than the cache, so this can be a copy; it goes
+        # to a name beside the entry and is renamed into place only once complete
+        shutil.move(mp3_path, part_path)
+        os.replace(part_path, cached_mp3_path)
+    finally:
+        cleanup_files([part_path])
+
+
+def _prune_mp3_cache():
+    """Remove the least recently used MP3s until the cache fits in MP3_CACHE_MAX_BYTES."""
+    entries = []
+    with os.scandir(MP3_CACHE_FOLDER) as it:
+        for entry in it:
+            if entry.name.endswith(".mp3"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    stale = []
+    for _, size, path in sorted(entries):
+        if total <= MP3_CACHE_MAX_BYTES:
+            break
+        stale.append(path)
+        total -= size
+    cleanup_files(stale)
+
+
+async def _stream_mp3(mp3_frames, cached_mp3_path):
+    """Yield the MP3 data _encode_to_cache produces from mp3_frames, re-raising its failure if it has one.
+
+    Rendering starts only once the response body is being sent, and holds one of
+    STREAM_SLOTS until the encoder has stopped, even if the client leaves early.
+    """
+    loop = asyncio.get_running_loop()
+    chunk_queue = asyncio.Queue(maxsize=STREAM_QUEUE_CHUNKS)
+    stop = threading.Event()
+    await STREAM_SLOTS.acquire()
+    try:
+        render = loop.run_in_executor(
+            RENDER_EXECUTOR, _encode_to_cache, mp3_frames, cached_mp3_path, loop, chunk_queue, stop
+        )
+    except BaseException:
+        STREAM_SLOTS.release()
+        raise
+    render.add_done_callback(lambda _: STREAM_SLOTS.release())
+    try:
+        while (chunk := await chunk_queue.get()) is not None:
+            if isinstance(chunk, Exception):
+                raise chunk
+            yield chunk
+    finally:
+        stop.set()
+        # Make room for a put the encoder may be blocked on, so it sees stop and exits
+        with contextlib.suppress(asyncio.QueueEmpty):
+            chunk_queue.get_nowait()
+
+@app.on_event("startup")
+def map_soundfont():
+    """Map the SoundFont read-only so its pages are resident before FluidSynth first loads it."""
+    app.state.soundfont_map = None
+    try:
+        soundfont_path = get_soundfont_path()
+    except FileNotFoundError as e:
+        logger.warning("SoundFont not preloaded: %s", e)
+        return
+    try:
+        with open(soundfont_path, "rb") as f:
+            soundfont_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError) as e:  # Unreadable, or empty (mmap refuses zero-length files)
+        logger.warning("SoundFont %s not preloaded: %s", soundfont_path, e)
+        return
+    if hasattr(mmap, "MADV_WILLNEED"):  # Not available on Windows
+        soundfont_map.madvise(mmap.MADV_WILLNEED)
+    app.state.soundfont_map = soundfont_map
+    logger.info("Mapped SoundFont %s (%d bytes)", soundfont_path, len(soundfont_map))
+
+@app.on_event("startup")
+def create_mp3_cache():
+    os.makedirs(MP3_CACHE_FOLDER, exist_ok=True)
+
+@app.on_event("startup")
+def create_slot_pool():
+    """Create this process's slot directories and queue every slot as free."""
+    global SLOT_ROOT, SLOT_POOL
+    SLOT_ROOT = tempfile.mkdtemp(prefix="slots_", dir=TMP_DIR)
+    SLOT_POOL = asyncio.Queue()
+    for i in range(SLOT_COUNT):
+        slot = f"slot_{i}"
+        os.mkdir(os.path.join(SLOT_ROOT, slot))
+        SLOT_POOL.put_nowait(slot)
+
+@app.on_event("startup")
+def warm_pipeline():
+    """Preload OMR and music21 before traffic, then start every EXECUTOR worker."""
+    logger.info("Preloading OMR and music21 modules...")
+    warm_up()
+    # The pool only starts workers as tasks arrive; submitting no-ops starts them all now,
+    # so no request waits on a worker's start-up and initializer
+    for _ in range(PROCESS_WORKERS):
+        EXECUTOR.submit(os.getpid)
+
+@app.on_event("startup")
+def start_job_sweeper():
+    # Held on app.state so the task is not garbage collected
+    app.state.job_sweeper = asyncio.create_task(_sweep_jobs())
+
+@app.on_event("shutdown")
+def stop_job_sweeper():
+    app.state.job_sweeper.cancel()
+
+@app.on_event("shutdown")
+def unmap_soundfont():
+    if app.state.soundfont_map is not None:
+        app.state.soundfont_map.close()
+
+@app.on_event("shutdown")
+def remove_slot_root():
+    if SLOT_ROOT is not None:
+        shutil.rmtree(SLOT_ROOT, ignore_errors=True)
 
 @app.get("/")
 def read_root():
@@ -42,7 +470,7 @@ def health_check():
             "status": "healthy",
             "soundfont_path": soundfont_path,
             "soundfont_exists": soundfont_exists,
-            "upload_folder_exists": os.path.exists(UPLOAD_FOLDER)
+            "upload_folder_exists": os.path.exists(TMP_DIR)
         }
     except Exception as e:
         return {
@@ -52,148 +480,158 @@ def health_check():
 
 @app.post("/process-sheet-music")
 async def process_sheet_music(image: UploadFile = File(...)):
-    unique_id = str(uuid.uuid4())
-    temp_image_path = os.path.join(UPLOAD_FOLDER, f"temp_upload_{unique_id}.png")
-    output_xml_path = f"output_{unique_id}.musicxml"
-    output_midi_path = f"output_{unique_id}.mid"
-    output_mp3_path = f"output_{unique_id}.mp3"
+    async with _slot() as slot:
+        return await _process_in_slot(image, _request_paths(slot))
+
+
+async def _process_in_slot(image, paths):
+    """Body of /process-sheet-music; every file it leaves in the slot is removed before returning."""
+    temp_image_path, output_xml_path, output_midi_path, output_mp3_path = paths
 
     try:
         # Step 1: Save uploaded image
-        logger.info(f"Saving uploaded image to {temp_image_path}")
-        with open(temp_image_path, "wb") as buffer:
-            content = await image.read()
-            buffer.write(content)
+        logger.info("Saving uploaded image to %s", temp_image_path)
+        upload_hash = await _save_upload(image, temp_image_path)
         logger.info("Image saved successfully")
 
-        # Step 2: Preprocess image
-        logger.info("Preprocessing image...")
-        preprocessed_path = preprocess_image(temp_image_path)
-        logger.info(f"Preprocessing completed: {preprocessed_path or temp_image_path}")
-
-        # Step 3: Process sheet music image to generate MusicXML
-        logger.info("Processing sheet music image to generate MusicXML...")
+        # Identical images have been converted before: return the cached MP3
+        loop = asyncio.get_running_loop()
+        cached_mp3_path = os.path.join(MP3_CACHE_FOLDER, f"{upload_hash}.mp3")
         try:
-            process_sheet_music_image(preprocessed_path if preprocessed_path else temp_image_path)
-        except Exception as e:
-            logger.error(f"MusicXML generation failed: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Failed to process sheet music image: {str(e)}")
-
-        # Step 3.1: Rename the generated MusicXML file to the unique name
-        if os.path.exists("output.musicxml"):
-            os.rename("output.musicxml", output_xml_path)
-            logger.info(f"Renamed MusicXML to {output_xml_path}")
+            # Touching the entry marks it as recently used for _prune_mp3_cache
+            await loop.run_in_executor(IO_EXECUTOR, os.utime, cached_mp3_path)
+        except FileNotFoundError:
+            pass
         else:
-            logger.error("MusicXML output file not found")
-            raise HTTPException(status_code=500, detail="Failed to generate MusicXML - output.musicxml not found")
+            logger.info("Serving cached MP3 %s", cached_mp3_path)
+            await remove_files([temp_image_path])
+            return FileResponse(cached_mp3_path, media_type="audio/mpeg", filename="sheet_music.mp3")
 
-        # Step 4: Convert MusicXML to MIDI
-        logger.info("Converting MusicXML to MIDI...")
+        # Steps 2-4: Preprocess, OMR, MusicXML -> MIDI
         try:
-            convert_musicxml_to_midi(output_xml_path, output_midi_path)
-        except Exception as e:
-            logger.error(f"MIDI conversion failed: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Failed to convert MusicXML to MIDI: {str(e)}")
-        if not os.path.exists(output_midi_path):
-            logger.error("MIDI output file not created")
-            raise HTTPException(status_code=500, detail="Failed to generate MIDI - output file not created")
-        logger.info("MIDI conversion successful")
-
-        # Step 5: Convert MIDI to MP3
-        logger.info("Converting MIDI to MP3...")
-        try:
-            # Check SoundFont before conversion
-            soundfont_path = get_soundfont_path()
-            logger.info(f"Using SoundFont: {soundfont_path}")
-            
-            if not os.path.exists(soundfont_path):
-                raise FileNotFoundError(f"SoundFont not found at: {soundfont_path}")
-            
-            # Perform conversion
-            midi_to_mp3(output_midi_path, output_mp3_path)
-            
-        except FileNotFoundError as e:
-            logger.error(f"SoundFont not found: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"SoundFont not found during MP3 conversion: {str(e)}")
-        except Exception as e:
-            logger.error(f"MP3 conversion failed: {str(e)}")
-            raise HTTPException(status_code=500, detail=f"Failed to convert MIDI to MP3: {str(e)}")
-        
-        if not os.path.exists(output_mp3_path):
-            logger.error("MP3 output file not created")
-            raise HTTPException(status_code=500, detail="Failed to generate MP3 - output file not created")
-        
-        logger.info("MP3 conversion successful")
+            await _run_to_midi(temp_image_path, output_xml_path, output_midi_path)
+            mp3_frames = await loop.run_in_executor(IO_EXECUTOR, _mp3_stream_stage, output_midi_path)
+        except PipelineError as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
-        # Step 6: Read MP3 file and prepare response
-        logger.info("Reading MP3 file for response...")
-        with open(output_mp3_path, "rb") as f:
-            mp3_content = f.read()
+        # Step 5, streamed: MP3 data goes out as it is encoded, while also filling the cache
+        if mp3_frames is not None:
+            return StreamingResponse(
+                _stream_mp3(mp3_frames, cached_mp3_path),
+                media_type="audio/mpeg",
+                headers={"Content-Disposition": 'attachment; filename="sheet_music.mp3"'}
+            )
 
-        # Verify MP3 content
-        if len(mp3_content) == 0:
+        # Step 5: Convert MIDI to MP3 on disk when it cannot be streamed
+        try:
+            await loop.run_in_executor(RENDER_EXECUTOR, _mp3_stage, output_midi_path, output_mp3_path)
+        except PipelineError as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+        # Step 6: Verify the MP3 before handing it to the response
+        mp3_size = (await aiofiles.os.stat(output_mp3_path)).st_size
+        if mp3_size == 0:
             logger.error("Generated MP3 file is empty")
             raise HTTPException(status_code=500, detail="Generated MP3 file is empty")
 
-        logger.info(f"MP3 file size: {len(mp3_content)} bytes")
+        logger.info("MP3 file size: %d bytes", mp3_size)
 
-        # Clean up temporary files
+        # Clean up temporary files; the MP3 is kept in the cache
         logger.info("Cleaning up temporary files...")
-        for file_path in [temp_image_path, preprocessed_path, output_xml_path, output_midi_path, output_mp3_path]:
-            try:
-                if file_path and os.path.exists(file_path):
-                    os.remove(file_path)
-                    logger.info(f"Removed: {file_path}")
-            except Exception as e:
-                logger.warning(f"Could not delete {file_path}: {str(e)}")
+        await remove_files([temp_image_path, output_xml_path, output_midi_path])
         logger.info("Cleanup completed")
+        await loop.run_in_executor(IO_EXECUTOR, _store_in_cache, output_mp3_path, cached_mp3_path)
+        await loop.run_in_executor(IO_EXECUTOR, _prune_mp3_cache)
 
-        # Return MP3 response
-        return Response(
-            content=mp3_content,
-            media_type="audio/mpeg",
-            headers={
-                "Content-Disposition": "attachment; filename=sheet_music.mp3",
-                "Content-Length": str(len(mp3_content))
-            }
-        )
+        # Stream the MP3 from disk instead of buffering it in memory
+        return FileResponse(cached_mp3_path, media_type="audio/mpeg", filename="sheet_music.mp3")
 
     except HTTPException as e:
+        await remove_files(paths)
         raise e
     except Exception as e:
-        logger.error(f"Unexpected error during processing: {str(e)}")
+        logger.error("Unexpected error during processing: %s", e)
         # Clean up on error
-        for file_path in [temp_image_path, preprocessed_path, output_xml_path, output_midi_path, output_mp3_path]:
-            try:
-                if file_path and os.path.exists(file_path):
-                    os.remove(file_path)
-            except Exception as cleanup_error:
-                logger.warning(f"Could not delete {file_path}: {str(cleanup_error)}")
+        await remove_files(paths)
         raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
 
-@app.post("/process-sheet-music-debug")
-async def process_sheet_music_debug(image: UploadFile = File(...)):
-    """Debug endpoint that returns detailed information about each step."""
-    unique_id = str(uuid.uuid4())
-    temp_image_path = os.path.join(UPLOAD_FOLDER, f"temp_upload_{unique_id}.png")
-    output_xml_path = f"output_{unique_id}.musicxml"
-    output_midi_path = f"output_{unique_id}.mid"
-    output_mp3_path = f"output_{unique_id}.mp3"
-    
-    debug_info = {
-        "steps": [],
-        "files_created": [],
-        "errors": []
-    }
 
+async def _run_job(job_id, slot):
+    """Run the pipeline for a /jobs submission, record its outcome in JOBS and free its slot."""
+    paths = _request_paths(slot)
+    output_mp3_path = paths[3]
     try:
-        # Step 1: Save uploaded image
-        debug_info["steps"].append("Saving uploaded image")
-        with open(temp_image_path, "wb") as buffer:
-            content = await image.read()
-            buffer.write(content)
-        debug_info["files_created"].append(temp_image_path)
+        await _run_pipeline(*paths)
+        # The slot is reused as soon as this job ends, so the MP3 waits for download outside it
+        job_mp3_path = os.path.join(TMP_DIR, f"job_{job_id}.mp3")
+        await aiofiles.os.replace(output_mp3_path, job_mp3_path)
+    except Exception as e:
+        JOBS[job_id] = {"status": "failed", "error": str(e), "finished_at": time.monotonic()}
+    else:
+        JOBS[job_id] = {"status": "done", "mp3_path": job_mp3_path, "finished_at": time.monotonic()}
+    finally:
+        await _release_slot(slot)
+
+
+async def _sweep_jobs():
+    """Forever drop finished jobs older than JOB_TTL_SECONDS, removing any uncollected MP3."""
+    while True:
+        await asyncio.sleep(JOB_SWEEP_INTERVAL)
+        cutoff = time.monotonic() - JOB_TTL_SECONDS
+        expired = [job_id for job_id, job in JOBS.items() if job.get("finished_at", cutoff) < cutoff]
+        for job_id in expired:
+            job = JOBS.pop(job_id)
+            if "mp3_path" in job:
+                await remove_files([job["mp3_path"]])
+        if expired:
+            logger.info("Expired %d uncollected jobs", len(expired))
+
 
+@app.post("/jobs")
+async def submit_job(image: UploadFile = File(...)):
+    """Queue an image for processing and return a job id to poll."""
+    job_id = str(uuid.uuid4())
+    slot = await SLOT_POOL.get()
+    try:
+        await _save_upload(image, _request_paths(slot)[0])
+    except BaseException:
+        await _release_slot(slot)
+        raise
+
+    # The job entry holds the task so it is not garbage collected while running
+    JOBS[job_id] = {"status": "running", "task": asyncio.create_task(_run_job(job_id, slot))}
+    return {"job_id": job_id}
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    """Return the status of a job submitted through /jobs."""
+    job = JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"job_id": job_id, "status": job["status"], "error": job.get("error")}
+
+
+@app.get("/jobs/{job_id}/result")
+def job_result(job_id: str):
+    """Return the MP3 of a finished job; the job is forgotten once downloaded."""
+    job = JOBS.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Job is {job['status']}")
+    del JOBS[job_id]
+    return FileResponse(
+        job["mp3_path"],
+        media_type="audio/mpeg",
+        filename="sheet_music.mp3",
+        background=BackgroundTask(cleanup_files, [job["mp3_path"]])
+    )
+
+def _debug_pipeline(paths, debug_info):
+    """Run the pipeline step by step, recording progress in debug_info. Runs in EXECUTOR."""
+    temp_image_path, output_xml_path, output_midi_path, output_mp3_path = paths
+    try:
         # Step 2: Preprocess image
         debug_info["steps"].append("Preprocessing image")
         preprocessed_path = preprocess_image(temp_image_path)
@@ -202,10 +640,9 @@ async def process_sheet_music_debug(image: UploadFile = File(...)):
 
         # Step 3: Process sheet music image
         debug_info["steps"].append("Processing sheet music to MusicXML")
-        process_sheet_music_image(preprocessed_path if preprocessed_path else temp_image_path)
+        process_sheet_music_image(preprocessed_path if preprocessed_path else temp_image_path, output_xml_path)
         
-        if os.path.exists("output.musicxml"):
-            os.rename("output.musicxml", output_xml_path)
+        if os.path.exists(output_xml_path):
             debug_info["files_created"].append(output_xml_path)
 
         # Step 4: Convert to MIDI
@@ -229,19 +666,43 @@ async def process_sheet_music_debug(image: UploadFile = File(...)):
             debug_info["errors"].append(f"MP3 conversion error: {str(e)}")
 
         # Clean up
-        for file_path in [temp_image_path, preprocessed_path, output_xml_path, output_midi_path, output_mp3_path]:
-            try:
-                if file_path and os.path.exists(file_path):
-                    os.remove(file_path)
-            except:
-                pass
+        cleanup_files([preprocessed_path, *paths])
 
-        return debug_info
+    except Exception as e:
+        debug_info["errors"].append(f"Processing error: {str(e)}")
+    return debug_info
+
+@app.post("/process-sheet-music-debug")
+async def process_sheet_music_debug(image: UploadFile = File(...)):
+    """Debug endpoint that returns detailed information about each step."""
+    async with _slot() as slot:
+        return await _debug_in_slot(image, _request_paths(slot))
+
+
+async def _debug_in_slot(image, paths):
+    """Body of /process-sheet-music-debug."""
+    temp_image_path = paths[0]
 
+    debug_info = {
+        "steps": [],
+        "files_created": [],
+        "errors": []
+    }
+
+    try:
+        # Step 1: Save uploaded image
+        debug_info["steps"].append("Saving uploaded image")
+        await _save_upload(image, temp_image_path)
+        debug_info["files_created"].append(temp_image_path)
+    except HTTPException:
+        raise  # Oversized uploads get the same 413 as the other endpoints
     except Exception as e:
         debug_info["errors"].append(f"Processing error: {str(e)}")
         return debug_info
 
+    # Steps 2-5 run in EXECUTOR, which hands back its own copy of debug_info
+    return await _run_in_process(_debug_pipeline, paths, debug_info)
+
 if __name__ == "__main__":
     import uvicorn
     try:
@@ -249,5 +710,5 @@ if __name__ == "__main__":
         uvicorn.run(app, host="0.0.0.0", port=8000)
         logger.info("Server started successfully")
     except Exception as e:
-        logger.error(f"Failed to start server: {str(e)}")
+        logger.error("Failed to start server: %s", e)
         raise
\ No newline at end of file
@@ -1,42 +1,77 @@
 import cv2
 import uuid
 import os
+import shutil
 import subprocess
 from music21 import converter
 import pygame
 
 # Define paths
-captured_image = f"captured_{uuid.uuid4().hex[:6]}.png"
 musicxml_output = "output.musicxml"
 midi_output = "output.mid"
 
+# Resolved once; the bare name is kept as a fallback so a missing tool raises FileNotFoundError
+_OEMER = shutil.which("oemer") or "oemer"
+
+# The live preview runs at this size; only the captured frame is taken at full resolution
+PREVIEW_SIZE = (640, 480)
+# Requested width/height for the capture; drivers clamp it to the largest size they support
+FULL_RESOLUTION_REQUEST = 10000
+
+def _set_resolution(cap, width, height):
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+
+def _grab_full(cap):
+    """Read one frame at the camera's full resolution, then return the stream to preview size."""
+    _set_resolution(cap, FULL_RESOLUTION_REQUEST, FULL_RESOLUTION_REQUEST)
+    ret, frame = cap.read()
+    _set_resolution(cap, *PREVIEW_SIZE)
+    return frame if ret else None
+
+def ensure_mixer():
+    """Open the audio device on first use and keep it open for every later playback."""
+    if not pygame.mixer.get_init():
+        pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=512)
+
 # Capture image from webcam
-def capture_sheet_music_image():
+def capture_sheet_music_image(upload_folder="."):
+    """
+    Capture a sheet music image using the webcam and save it in upload_folder under a
+    unique name. Returns the saved path, or None if nothing was captured.
+    """
+    image_path = os.path.join(upload_folder, f"captured_{uuid.uuid4().hex[:6]}.png")
+    saved = False
     cap = cv2.VideoCapture(0)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)  # Always preview the newest frame
+    _set_resolution(cap, *PREVIEW_SIZE)
     print("📷 Press SPACE to capture sheet music, or ESC to exit.")
     while True:
         ret, frame = cap.read()
         if not ret:
             break
-        cv2.imshow("Sheet Music Capture", frame)
+        # UMat keeps the resize on the OpenCL device where one is available
+        preview = cv2.resize(cv2.UMat(frame), PREVIEW_SIZE)
+        cv2.imshow("Sheet Music Capture", preview)
         key = cv2.waitKey(1)
         if key % 256 == 27:  # ESC
             print("❌ Capture canceled.")
             break
         elif key % 256 == 32:  # SPACE
-            cv2.imwrite(captured_image, frame)
-            print(f"✅ Image saved as {captured_image}")
+            full_frame = _grab_full(cap)
+            saved = cv2.imwrite(image_path, full_frame if full_frame is not None else frame)
+            print(f"✅ Image saved as {image_path}")
             break
     cap.release()
     cv2.destroyAllWindows()
+    return image_path if saved else None
 
 # Process with OMR (oemer)
 def run_omr(image_path):
-    command = f'oemer "{image_path}" -o {musicxml_output}'
     try:
-        subprocess.run(command, shell=True, check=True)
+        subprocess.run([_OEMER, image_path, "-o", musicxml_output], check=True)
         print(f"✅ MusicXML generated: {musicxml_output}")
-    except subprocess.CalledProcessError as e:
+    except (subprocess.CalledProcessError, FileNotFoundError) as e:
         print(f"⚠️ OMR failed: {e}")
 
 # Convert to MIDI and play
@@ -45,18 +80,18 @@ def convert_and_play_music(musicxml_file, midi_file):
         score = converter.parse(musicxml_file)
         score.write('midi', fp=midi_file)
         print(f"🎼 MIDI generated: {midi_file}")
-        pygame.mixer.init()
+        ensure_mixer()
         pygame.mixer.music.load(midi_file)
         pygame.mixer.music.play()
         while pygame.mixer.music.get_busy():
-            pygame.time.Clock().tick(10)
+            pygame.time.wait(100)
     except Exception as e:
         print(f"⚠️ Error in MIDI playback: {e}")
 
 # Main execution
 if __name__ == "__main__":
-    capture_sheet_music_image()
-    if os.path.exists(captured_image):
+    captured_image = capture_sheet_music_image()
+    if captured_image:
         run_omr(captured_image)
         if os.path.exists(musicxml_output):
             convert_and_play_music(musicxml_output, midi_output)
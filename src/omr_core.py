@@ -0,0 +1,210 @@
+"""OMR pipeline used by the API server: image preprocessing, oemer and music21.
+
+Nothing here touches audio devices, so it is cheap to import in server workers.
+"""
+import os
+import hashlib
+import pickle
+import shutil
+import subprocess
+import functools
+import tempfile
+from argparse import Namespace
+import music21
+from music21 import converter, stream
+import cv2
+import symusic
+
+output_xml_path = "output.musicxml"
+
+# Resolved once; the bare name is kept as a fallback so a missing tool raises FileNotFoundError
+_OEMER = shutil.which("oemer") or "oemer"
+
+# Parsed scores are pickled here, keyed by the SHA-256 of the MusicXML they came from.
+# Pickles only load under the music21 version that wrote them, so each version gets its own
+# directory, and only the most recently used entries are kept.
+PARSE_CACHE_DIR = os.path.join(".cache", f"music21-{music21.__version__}")
+PARSE_CACHE_MAX_ENTRIES = 128
+
+# How many oemer runs may go at once, in the server's process pool or the CLI's --parallel mode.
+# Each loads its own models, needs hundreds of MB to GBs of memory and uses several cores.
+MAX_OMR_WORKERS = int(os.environ.get("OMR_WORKERS", 2))
+
+# MIDI resolution and note velocity used when writing MIDI
+MIDI_TICKS_PER_QUARTER = 480
+DEFAULT_VELOCITY = 90
+
+def preprocess_image(image_path: str):
+    """
+    Preprocess the image if necessary (e.g., resizing, converting to grayscale).
+    This function can be expanded based on specific requirements.
+    """
+    img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)  # Grayscale
+    if img is None:
+        raise ValueError(f"Could not read image: {image_path}")
+    img = cv2.normalize(img, None, 0, 255, cv2.NORM_MINMAX)  # Auto-contrast
+    # Written next to the input and named after it, so concurrent requests never share a file
+    stem, _ = os.path.splitext(image_path)
+    preprocessed_path = f"{stem}_preprocessed.png"
+    # oemer reads this straight back, so skip deflate compression entirely
+    cv2.imwrite(preprocessed_path, img, [cv2.IMWRITE_PNG_COMPRESSION, 0])
+    print(f"Preprocessed image saved at: {preprocessed_path}")
+    return preprocessed_path
+
+@functools.lru_cache(maxsize=1)
+def _oemer_ete():
+    """Import oemer's end-to-end pipeline once per process."""
+    from oemer import ete
+    return ete
+
+def _oemer_checkpoints_ready():
+    """oemer only downloads its model checkpoints when run from the command line."""
+    import oemer
+    return os.path.exists(os.path.join(oemer.MODULE_PATH, "checkpoints", "unet_big", "model.onnx"))
+
+def omr_device():
+    """Return "cuda" if oemer's ONNX models will run on the GPU, else "cpu".
+
+    oemer asks ONNX Runtime for CUDAExecutionProvider before CPU on its own; the GPU is
+    only used when the onnxruntime-gpu build is installed in place of onnxruntime.
+    """
+    try:
+        import onnxruntime
+    except ImportError:
+        return "cpu"
+    return "cuda" if "CUDAExecutionProvider" in onnxruntime.get_available_providers() else "cpu"
+
+def warm_up():
+    """Load music21's converter registry and oemer before the first image arrives."""
+    converter.Converter()
+    try:
+        _oemer_ete()
+    except ImportError as e:
+        print(f"oemer could not be preloaded: {e}")
+    if omr_device() == "cpu":
+        print("OMR will run on the CPU; install onnxruntime-gpu to run it with CUDA")
+
+# Function to process the sheet music image using OMER
+def process_sheet_music_image(image_path: str, out_xml: str = output_xml_path):
+    """Run oemer on image_path and write MusicXML to out_xml; raises if OMR fails."""
+    try:
+        if _oemer_checkpoints_ready():
+            # Run oemer in this process instead of paying interpreter startup per image
+            ete = _oemer_ete()
+            ete.clear_data()
+            with tempfile.TemporaryDirectory() as out_dir:
+                args = Namespace(
+                    img_path=image_path,
+                    output_path=out_dir,
+                    use_tf=False,
+                    save_cache=False,
+                    without_deskew=False,
+                )
+                # extract() names its output after the image, so move it to the requested path
+                shutil.move(ete.extract(args), out_xml)
+        else:
+            # Run the oemer tool directly, without a shell, to generate MusicXML
+            subprocess.run([_OEMER, image_path, "-o", out_xml], check=True)
+        print(f"Successfully generated MusicXML at {out_xml}")
+    except subprocess.CalledProcessError as e:
+        print(f"Error during OMR processing: {e}")
+        raise
+
+def cached_parse(musicxml_file):
+    """converter.parse, memoised on disk so the same MusicXML is only parsed once."""
+    with open(musicxml_file, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()
+    cache_path = os.path.join(PARSE_CACHE_DIR, f"{digest}.pkl")
+    try:
+        with open(cache_path, "rb") as f:
+            score = pickle.load(f)
+        os.utime(cache_path)  # Mark as recently used for _prune_parse_cache
+        return score
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        # Truncated, corrupt or otherwise unloadable: treat as a miss and drop the entry
+        print(f"Discarding unreadable parse cache entry {cache_path}: {e}")
+        _remove_cache_files([cache_path])
+
+    score = converter.parse(musicxml_file)
+    tmp_path = None
+    try:
+        os.makedirs(PARSE_CACHE_DIR, exist_ok=True)
+        # Written under a temporary name so a concurrent reader never sees a partial pickle
+        fd, tmp_path = tempfile.mkstemp(dir=PARSE_CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(score, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, cache_path)
+        _prune_parse_cache()
+    except Exception as e:
+        print(f"Could not cache parsed score: {e}")
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return score
+
+def _prune_parse_cache():
+    """Delete the least recently used pickles beyond PARSE_CACHE_MAX_ENTRIES."""
+    entries = []
+    with os.scandir(PARSE_CACHE_DIR) as it:
+        for entry in it:
+            if entry.name.endswith(".pkl"):
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    pass
+    entries.sort(reverse=True)
+    _remove_cache_files(path for _, path in entries[PARSE_CACHE_MAX_ENTRIES:])
+
+def _remove_cache_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def _ticks(quarter_length):
+    return round(float(quarter_length) * MIDI_TICKS_PER_QUARTER)
+
+def write_midi(score, midi_file):
+    """Write a music21 stream as MIDI with symusic's C++ writer, much faster than music21's."""
+    midi = symusic.Score(MIDI_TICKS_PER_QUARTER)
+    for mark in score.flatten().getElementsByClass('MetronomeMark'):
+        bpm = mark.getQuarterBPM()
+        if bpm:
+            midi.tempos.append(symusic.Tempo(_ticks(mark.offset), qpm=bpm))
+
+    parts = score.parts if hasattr(score, 'parts') and len(score.parts) else [score]
+    for part in parts:
+        instrument = part.getInstrument(returnDefault=True)
+        track = symusic.Track(
+            name=part.partName or "",
+            program=instrument.midiProgram or 0,
+            is_drum=instrument.midiChannel == 9,
+        )
+        # Tied notes are merged so each sounds once for its full length, as music21 writes them
+        for element in part.flatten().stripTies().notes:
+            duration = _ticks(element.duration.quarterLength)
+            if duration <= 0:  # Grace notes have no written length
+                continue
+            onset = _ticks(element.offset)
+            velocity = element.volume.velocity or DEFAULT_VELOCITY
+            for pitch in getattr(element, 'pitches', ()):
+                track.notes.append(symusic.Note(onset, duration, pitch.midi, velocity))
+        midi.tracks.append(track)
+    midi.dump_midi(midi_file)
+
+# Convert MusicXML to MIDI using music21
+def convert_musicxml_to_midi(musicxml_file, midi_file):
+    """Write midi_file from a MusicXML path, or from an already parsed music21 stream."""
+    try:
+        if isinstance(musicxml_file, stream.Stream):
+            score = musicxml_file
+        else:
+            # Not cached_parse: every upload yields different MusicXML, so the server would
+            # only fill the disk with pickles that are never read back
+            score = converter.parse(musicxml_file)
+        write_midi(score, midi_file)
+        print(f"Successfully converted MusicXML to MIDI: {midi_file}")
+    except Exception as e:
+        print(f"Error converting MusicXML to MIDI: {e}")
@@ -0,0 +1,12 @@
+"""Local MIDI playback for command-line use; the API server never imports this."""
+import os
+import subprocess
+import sys
+
+# Function to play MIDI with the platform's default player
+def play_midi(midi_file):
+    if sys.platform == "win32":
+        print(f"Playing MIDI file on Windows: {midi_file}")
+        os.startfile(midi_file)
+    else:
+        subprocess.run(["open", midi_file])
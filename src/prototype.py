@@ -1,13 +1,8 @@
 import os
+import shutil
 import subprocess
-import pygame
-from music21 import converter, midi
-import sys
-from PIL import Image, ImageOps
-
-# Define paths
-UPLOAD_FOLDER = 'uploads'
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+from src.omr_core import preprocess_image, process_sheet_music_image, convert_musicxml_to_midi
+from src.omr_play import play_midi
 
 # take the current directory as the working directory
 path = os.getcwd()
@@ -16,44 +11,33 @@ output_xml_path = "output.musicxml"
 output_midi_path = "output.mid"
 output_wav_path = "output.wav"
 
-def preprocess_image(image_path: str):
-    """
-    Preprocess the image if necessary (e.g., resizing, converting to grayscale).
-    This function can be expanded based on specific requirements.
-    """
-    img = Image.open(image_path).convert("L")  # Grayscale
-    img = ImageOps.autocontrast(img)            # Auto-contrast
-    preprocessed_path = os.path.join(UPLOAD_FOLDER, "preprocessed.png")
-    img.save(preprocessed_path)
-    print(f"Preprocessed image saved at: {preprocessed_path}")
-    return preprocessed_path
+# Resolved once; the bare names are kept as fallbacks so a missing tool raises FileNotFoundError
+_FLUIDSYNTH = shutil.which("fluidsynth") or "fluidsynth"
+_TIMIDITY = shutil.which("timidity") or "timidity"
 
-# Function to process the sheet music image using OMER
-def process_sheet_music_image(image_path: str):
-    try:
-        # Command to run the oemer tool and generate MusicXML
-        command = f'oemer "{image_path}" -o {output_xml_path}'
-        subprocess.run(command, shell=True, check=True)
-        print(f"Successfully generated MusicXML at {output_xml_path}")
-    except subprocess.CalledProcessError as e:
-        print(f"Error during OMR processing: {e}")
+# Common soundfont paths, in search order
+_SOUNDFONT_PATHS = [
+    "/usr/share/sounds/sf2/FluidR3_GM.sf2",  # Linux
+    "/usr/local/share/sounds/sf2/FluidR3_GM.sf2",  # macOS Homebrew
+    "/opt/homebrew/share/sounds/sf2/FluidR3_GM.sf2",  # macOS Apple Silicon Homebrew
+    os.path.expanduser("~/soundfonts/FluidR3_GM.sf2"),  # User's home directory
+    "soundfonts/FluidR3_GM.sf2",  # Relative to current directory
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "soundfonts", "FluidR3_GM.sf2"),  # Project soundfonts directory
+]
 
-# Function to play MIDI using pygame
-def play_midi(midi_file):
-    if sys.platform == "win32":
-        print(f"Playing MIDI file on Windows: {midi_file}")
-        os.startfile(midi_file)
-    else:
-        subprocess.run(["open", midi_file])
+# Set by _find_soundfont once a soundfont is found
+_found_soundfont = None
 
-# Convert MusicXML to MIDI using music21
-def convert_musicxml_to_midi(musicxml_file, midi_file):
-    try:
-        score = converter.parse(musicxml_file)
-        score.write('midi', fp=midi_file)
-        print(f"Successfully converted MusicXML to MIDI: {midi_file}")
-    except Exception as e:
-        print(f"Error converting MusicXML to MIDI: {e}")
+def _find_soundfont():
+    """Return the first soundfont in _SOUNDFONT_PATHS that exists.
+
+    A hit is remembered for the rest of the process; a miss is not, so a soundfont
+    installed while the process runs is still picked up.
+    """
+    global _found_soundfont
+    if _found_soundfont is None:
+        _found_soundfont = next((sf_path for sf_path in _SOUNDFONT_PATHS if os.path.exists(sf_path)), None)
+    return _found_soundfont
 
 # Convert MIDI to WAV using fluidsynth if available, or another method
 def convert_midi_to_wav(midi_file, wav_file):
@@ -73,32 +57,19 @@ def convert_midi_to_wav(midi_file, wav_file):
     try:
         # First try with fluidsynth if available
         try:
-            # Check common soundfont paths
-            soundfont_paths = [
-                "/usr/share/sounds/sf2/FluidR3_GM.sf2",  # Linux
-                "/usr/local/share/sounds/sf2/FluidR3_GM.sf2",  # macOS Homebrew
-                "/opt/homebrew/share/sounds/sf2/FluidR3_GM.sf2",  # macOS Apple Silicon Homebrew
-                os.path.expanduser("~/soundfonts/FluidR3_GM.sf2"),  # User's home directory
-                "soundfonts/FluidR3_GM.sf2",  # Relative to current directory
-                os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "soundfonts", "FluidR3_GM.sf2"),  # Project soundfonts directory
-            ]
-            
             # Try to find a soundfont file
-            soundfont_path = None
-            for sf_path in soundfont_paths:
-                if os.path.exists(sf_path):
-                    soundfont_path = sf_path
-                    conversion_info["soundfont_used"] = sf_path
-                    print(f"Found SoundFont at: {sf_path}")
-                    break
+            soundfont_path = _find_soundfont()
+            if soundfont_path:
+                conversion_info["soundfont_used"] = soundfont_path
+                print(f"Found SoundFont at: {soundfont_path}")
                     
             # If no soundfont found, use a fallback approach
             if not soundfont_path:
                 print("No SoundFont found. Using pure Python audio generation.")
                 conversion_info["message"] = "No SoundFont found for FluidSynth"
             if soundfont_path:
-                command = f"fluidsynth -ni {soundfont_path} {midi_file} -F {wav_file} -r 44100"
-                result = subprocess.run(command, shell=True, check=True, capture_output=True)
+                command = [_FLUIDSYNTH, "-ni", soundfont_path, midi_file, "-F", wav_file, "-r", "44100"]
+                result = subprocess.run(command, check=True, capture_output=True)
                 print(f"Successfully converted MIDI to WAV using FluidSynth: {wav_file}")
                 conversion_info["success"] = True
                 conversion_info["method"] = "fluidsynth"
@@ -110,8 +81,8 @@ def convert_midi_to_wav(midi_file, wav_file):
             
             # Alternate method using timidity if available
             try:
-                command = f"timidity {midi_file} -Ow -o {wav_file}"
-                result = subprocess.run(command, shell=True, check=True, capture_output=True)
+                command = [_TIMIDITY, midi_file, "-Ow", "-o", wav_file]
+                result = subprocess.run(command, check=True, capture_output=True)
                 print(f"Successfully converted MIDI to WAV using TiMidity: {wav_file}")
                 conversion_info["success"] = True
                 conversion_info["method"] = "timidity"
@@ -156,7 +127,9 @@ def create_placeholder_audio(wav_file, duration=5.0, freq=440.0, sample_rate=441
         from scipy.io import wavfile
         
         # Try to create a more interesting melody as a placeholder
-        t = np.linspace(0, duration, int(sample_rate * duration), False)
+        # float32 throughout: plenty for 16-bit output, and half the memory traffic of float64
+        t = np.linspace(0, duration, int(sample_rate * duration), False, dtype=np.float32)
+        two_pi = np.float32(2 * np.pi)
         
         # Create a simple melody using the pentatonic scale
         melody = np.zeros_like(t)
@@ -168,28 +141,33 @@ def create_placeholder_audio(wav_file, duration=5.0, freq=440.0, sample_rate=441
         segments = 10
         seg_len = len(t) // segments
         
-        for i in range(segments):
-            start = i * seg_len
-            end = (i + 1) * seg_len if i < segments - 1 else len(t)
-            note_freq = penta_freqs[i % len(penta_freqs)]
-            
-            # Add a simple envelope to avoid clicks
-            env = np.ones(end - start)
-            attack = int((end - start) * 0.1)  # 10% attack
-            decay = int((end - start) * 0.2)    # 20% decay
-            env[:attack] = np.linspace(0, 1, attack)
-            env[-decay:] = np.linspace(1, 0, decay)
-            
-            melody[start:end] = np.sin(note_freq * 2 * np.pi * t[start:end]) * env * 0.8
+        # Add a simple envelope to avoid clicks, shared by every segment
+        env = np.ones(seg_len, dtype=np.float32)
+        attack = int(seg_len * 0.1)  # 10% attack
+        decay = int(seg_len * 0.2)    # 20% decay
+        env[:attack] = np.linspace(0, 1, attack, dtype=np.float32)
+        env[-decay:] = np.linspace(1, 0, decay, dtype=np.float32)
+        env *= np.float32(0.8)  # Melody volume
         
-        # Add a harmony an octave lower
-        harmony = np.sin(220.0 * 2 * np.pi * t) * 0.3
+        # One row per segment, so every note is synthesised by a single sin call.
+        # The rows are a view of melody and every step writes into it, so no temporaries
+        note_freqs = np.array([penta_freqs[i % len(penta_freqs)] for i in range(segments)], dtype=np.float32)
+        seg_t = t[:segments * seg_len].reshape(segments, seg_len)
+        seg_melody = melody[:segments * seg_len].reshape(segments, seg_len)
+        np.multiply(seg_t, note_freqs[:, None] * two_pi, out=seg_melody)
+        np.sin(seg_melody, out=seg_melody)
+        np.multiply(seg_melody, env, out=seg_melody)
         
-        # Combine melody and harmony
-        audio_data = melody + harmony
+        # Add a harmony an octave lower, built in one scratch buffer and mixed in place
+        harmony = np.multiply(t, np.float32(220.0) * two_pi)
+        np.sin(harmony, out=harmony)
+        harmony *= np.float32(0.3)
+        audio_data = melody
+        audio_data += harmony
         
-        # Normalize
-        audio_data = audio_data * 32767 / np.max(np.abs(audio_data))
+        # Normalize in place; the peak is found without an abs() copy of the buffer
+        peak = max(float(audio_data.max()), -float(audio_data.min()))
+        audio_data *= np.float32(32767 / peak)
         audio_data = audio_data.astype(np.int16)
         
         # Save as WAV file
@@ -1,54 +1,86 @@
+import os
+import heapq
+import tempfile
+from math import hypot
 import cv2
 import numpy as np
 
-def enhance_scanned_image(input_path, output_path="scanned_output.png"):
+# Scans are written to RAM-backed /dev/shm where available, since oemer reads them straight back
+SCAN_FOLDER = "/dev/shm" if os.path.isdir("/dev/shm") else "."
+
+# Page edges are detected on a copy this many pixels tall; only the warp uses full resolution
+DETECTION_HEIGHT = 500
+
+def enhance_scanned_image(input_path, output_path=None):
+    """
+    Clean up the image, enhance contrast, and apply adaptive thresholding.
+    The result goes to output_path, or to a new uniquely named PNG in SCAN_FOLDER
+    that the caller should remove once done with it.
+    """
     img = cv2.imread(input_path)
-    orig = img.copy()
+    if img is None:
+        raise ValueError(f"Could not read image: {input_path}")
+    # Converted once: edge detection and the warp below both work on this single channel
     gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    blur = cv2.GaussianBlur(gray, (5, 5), 0)
+    ratio = max(gray.shape[0] / DETECTION_HEIGHT, 1.0)
+    if ratio > 1.0:
+        small = cv2.resize(gray, (round(gray.shape[1] / ratio), round(gray.shape[0] / ratio)), interpolation=cv2.INTER_AREA)
+    else:
+        small = gray
+    blur = cv2.GaussianBlur(small, (5, 5), 0)
     edged = cv2.Canny(blur, 75, 200)
 
     # Find contours
     contours, _ = cv2.findContours(edged, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
-    contours = sorted(contours, key=cv2.contourArea, reverse=True)
+    # The page is one of the largest contours, so only those are tried
+    contours = heapq.nlargest(10, contours, key=cv2.contourArea)
+    min_area = 0.2 * small.shape[0] * small.shape[1]
 
+    doc_cnt = None
     for c in contours:
+        if cv2.contourArea(c) < min_area:
+            break  # Too small to be the page; the remaining contours are smaller still
         peri = cv2.arcLength(c, True)
         approx = cv2.approxPolyDP(c, 0.02 * peri, True)
         if len(approx) == 4:
-            doc_cnt = approx
+            doc_cnt = approx * ratio  # Back to full-resolution coordinates
             break
-    else:
+    if doc_cnt is None:
         print("⚠️ Document edges not found, using original image.")
         doc_cnt = np.array([[[0,0]], [[img.shape[1],0]], [[img.shape[1], img.shape[0]]], [[0, img.shape[0]]]])
 
     # Reorder points and apply perspective transform
     def reorder(pts):
-        pts = pts.reshape(4, 2)
-        new_pts = np.zeros((4, 2), dtype="float32")
+        # Top-left has the smallest x+y, bottom-right the largest; top-right has the
+        # largest x-y, bottom-left the smallest
+        pts = pts.reshape(4, 2).astype(np.float32)
         s = pts.sum(axis=1)
-        diff = np.diff(pts, axis=1)
-        new_pts[0] = pts[np.argmin(s)]
-        new_pts[2] = pts[np.argmax(s)]
-        new_pts[1] = pts[np.argmin(diff)]
-        new_pts[3] = pts[np.argmax(diff)]
-        return new_pts
+        d = pts[:, 0] - pts[:, 1]
+        return pts[[s.argmin(), d.argmax(), s.argmax(), d.argmin()]]
 
     pts1 = reorder(doc_cnt)
     (tl, tr, br, bl) = pts1
-    width = max(np.linalg.norm(br - bl), np.linalg.norm(tr - tl))
-    height = max(np.linalg.norm(tr - br), np.linalg.norm(tl - bl))
+    width = max(hypot(br[0] - bl[0], br[1] - bl[1]), hypot(tr[0] - tl[0], tr[1] - tl[1]))
+    height = max(hypot(tr[0] - br[0], tr[1] - br[1]), hypot(tl[0] - bl[0], tl[1] - bl[1]))
 
     pts2 = np.array([[0,0], [width-1,0], [width-1,height-1], [0,height-1]], dtype="float32")
     matrix = cv2.getPerspectiveTransform(pts1, pts2)
-    scanned = cv2.warpPerspective(orig, matrix, (int(width), int(height)))
+    scanned_gray = cv2.warpPerspective(gray, matrix, (int(width), int(height)))
 
-    # Convert to grayscale and apply adaptive threshold for whitening
-    scanned_gray = cv2.cvtColor(scanned, cv2.COLOR_BGR2GRAY)
+    # Apply adaptive threshold for whitening; the box mean is as good as a Gaussian
+    # for printed music and much cheaper to compute
     scanned_clean = cv2.adaptiveThreshold(scanned_gray, 255,
-                                          cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
+                                          cv2.ADAPTIVE_THRESH_MEAN_C,
                                           cv2.THRESH_BINARY, 11, 10)
 
-    cv2.imwrite(output_path, scanned_clean)
+    if output_path is None:
+        # SCAN_FOLDER is shared with other users, so a fixed name could be overwritten or
+        # planted as a symlink; mkstemp creates a fresh file only this process can write.
+        # Created only now, so a failure above leaves nothing behind
+        fd, output_path = tempfile.mkstemp(prefix="scanned_", suffix=".png", dir=SCAN_FOLDER)
+        os.close(fd)
+
+    # oemer reads this straight back; light deflate is nearly as small on a binary image
+    cv2.imwrite(output_path, scanned_clean, [cv2.IMWRITE_PNG_COMPRESSION, 1])
     print(f"✅ Scanned image saved as {output_path}")
     return output_path
@@ -1,143 +1,263 @@
 import os
+import argparse
+import shutil
 import subprocess
-import uuid
+import tempfile
+import threading
+import time
+import queue
+from concurrent.futures import ThreadPoolExecutor
 import pygame
-from music21 import converter, midi
+from music21 import converter, midi, stream
 import cv2
 import numpy as np
+from src.omr_core import MAX_OMR_WORKERS, cached_parse, write_midi
+# Capture and scanning live in one place each; re-exported here for existing callers
+from src.cam import capture_sheet_music_image, ensure_mixer
+from src.scanner import enhance_scanned_image
 
 # Path where files will be saved
 UPLOAD_FOLDER = 'uploads'
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-# Function to capture an image from the webcam
-def capture_sheet_music_image():
-    """
-    Capture a sheet music image using the webcam.
-    The image will be saved with a unique name.
-    """
-    captured_image = f"captured_{uuid.uuid4().hex[:6]}.png"
-    cap = cv2.VideoCapture(0)
-    print("📷 Press SPACE to capture sheet music, or ESC to exit.")
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        cv2.imshow("Sheet Music Capture", frame)
-        key = cv2.waitKey(1)
-        if key % 256 == 27:  # ESC
-            print("❌ Capture canceled.")
-            break
-        elif key % 256 == 32:  # SPACE
-            cv2.imwrite(os.path.join(UPLOAD_FOLDER, captured_image), frame)
-            print(f"✅ Image saved as {captured_image}")
-            break
-    cap.release()
-    cv2.destroyAllWindows()
-    return os.path.join(UPLOAD_FOLDER, captured_image)
-
-# Function to enhance and clean up the scanned image
-def enhance_scanned_image(input_path, output_path="scanned_output.png"):
-    """
-    Clean up the image, enhance contrast, and apply adaptive thresholding.
-    """
-    img = cv2.imread(input_path)
-    orig = img.copy()
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    blur = cv2.GaussianBlur(gray, (5, 5), 0)
-    edged = cv2.Canny(blur, 75, 200)
-
-    contours, _ = cv2.findContours(edged, cv2.RETR_LIST, cv2.CHAIN_APPROX_SIMPLE)
-    contours = sorted(contours, key=cv2.contourArea, reverse=True)
-
-    for c in contours:
-        peri = cv2.arcLength(c, True)
-        approx = cv2.approxPolyDP(c, 0.02 * peri, True)
-        if len(approx) == 4:
-            doc_cnt = approx
-            break
-    else:
-        print("⚠️ Document edges not found, using original image.")
-        doc_cnt = np.array([[[0,0]], [[img.shape[1],0]], [[img.shape[1], img.shape[0]]], [[0, img.shape[0]]]])
-
-    def reorder(pts):
-        pts = pts.reshape(4, 2)
-        new_pts = np.zeros((4, 2), dtype="float32")
-        s = pts.sum(axis=1)
-        diff = np.diff(pts, axis=1)
-        new_pts[0] = pts[np.argmin(s)]
-        new_pts[2] = pts[np.argmax(s)]
-        new_pts[1] = pts[np.argmin(diff)]
-        new_pts[3] = pts[np.argmax(diff)]
-        return new_pts
-
-    pts1 = reorder(doc_cnt)
-    (tl, tr, br, bl) = pts1
-    width = max(np.linalg.norm(br - bl), np.linalg.norm(tr - tl))
-    height = max(np.linalg.norm(tr - br), np.linalg.norm(tl - bl))
-
-    pts2 = np.array([[0,0], [width-1,0], [width-1,height-1], [0,height-1]], dtype="float32")
-    matrix = cv2.getPerspectiveTransform(pts1, pts2)
-    scanned = cv2.warpPerspective(orig, matrix, (int(width), int(height)))
-
-    scanned_gray = cv2.cvtColor(scanned, cv2.COLOR_BGR2GRAY)
-    scanned_clean = cv2.adaptiveThreshold(scanned_gray, 255,
-                                          cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
-                                          cv2.THRESH_BINARY, 11, 10)
-
-    cv2.imwrite(output_path, scanned_clean)
-    print(f"✅ Scanned image saved as {output_path}")
-    return output_path
+# Resolved once; the bare name is kept as a fallback so a missing tool raises FileNotFoundError
+_OEMER = shutil.which("oemer") or "oemer"
+
+# With --parallel, the page is cut into bands wherever at least STAFF_GAP_FRACTION of its
+# height is blank; a row counts as blank when under INK_ROW_FRACTION of it is black
+STAFF_GAP_FRACTION = 0.02
+INK_ROW_FRACTION = 0.01
+# Rows more than STAFF_LINE_FRACTION black are taken as staff lines, five to a staff
+STAFF_LINE_FRACTION = 0.5
 
 # Function to run OMR (Optical Music Recognition) with oemer
 def run_omr(image_path, output_xml_path="output.musicxml"):
     """
     Use oemer to convert the scanned image to MusicXML.
     """
-    command = f'oemer "{image_path}" -o {output_xml_path}'
     try:
-        subprocess.run(command, shell=True, check=True)
+        subprocess.run([_OEMER, image_path, "-o", output_xml_path], check=True)
         print(f"✅ MusicXML generated: {output_xml_path}")
-    except subprocess.CalledProcessError as e:
+    except (subprocess.CalledProcessError, FileNotFoundError) as e:
         print(f"⚠️ OMR failed: {e}")
         return None
     return output_xml_path
 
-# Function to convert MusicXML to MIDI and play it
-def convert_and_play_music(musicxml_file, midi_file="output.mid"):
+def _split_staves(img):
+    """Split a binarized page into horizontal bands, one per staff system, top to bottom."""
+    height, width = img.shape[:2]
+    inked = np.count_nonzero(img == 0, axis=1) > width * INK_ROW_FRACTION
+    # Start/end rows of each run of inked rows
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], inked.view(np.int8), [0]))))
+    runs = edges.reshape(-1, 2)
+
+    min_gap = max(1, int(height * STAFF_GAP_FRACTION))
+    bands = []
+    for start, end in runs:
+        # Same system: notes and beams span small gaps between staff lines, and the staves of
+        # a grand staff are joined by the system's barlines however far apart they are
+        if bands and (start - bands[-1][1] < min_gap or _joined(img, bands[-1][1], start)):
+            bands[-1][1] = end
+        else:
+            bands.append([start, end])
+
+    # Keep half of each blank gap on either side so stems and ledger lines are not clipped
+    margin = min_gap // 2
+    crops = [img[max(0, start - margin):min(height, end + margin)] for start, end in bands]
+    # Systems on one page have the same staves; if the bands disagree, the cuts did not
+    # follow the systems, so the page is kept whole
+    if len({_count_staves(crop) for crop in crops}) > 1:
+        return [img]
+    return crops
+
+def _joined(img, top, bottom):
+    """True if some column is black on every row from top to bottom, like a barline."""
+    return bool(np.any(np.all(img[top:bottom] == 0, axis=0)))
+
+def _count_staves(band):
+    """Number of five-line staves in a binarized band."""
+    width = band.shape[1]
+    line_rows = np.count_nonzero(band == 0, axis=1) > width * STAFF_LINE_FRACTION
+    # Each run of staff-line rows is one line, however many pixels thick
+    lines = np.count_nonzero(np.diff(np.concatenate(([0], line_rows.view(np.int8)))) == 1)
+    return lines // 5
+
+def _run_single_oemer(crop_path):
+    """Run oemer on one band; returns its MusicXML path, or None if oemer found nothing to read."""
+    xml_path = os.path.splitext(crop_path)[0] + ".musicxml"
+    try:
+        subprocess.run([_OEMER, crop_path, "-o", xml_path], check=True, capture_output=True)
+    except (subprocess.CalledProcessError, FileNotFoundError) as e:
+        print(f"⚠️ OMR failed for {os.path.basename(crop_path)}: {e}")
+        return None
+    return xml_path if os.path.exists(xml_path) else None
+
+def _merge_scores(xml_paths):
+    """Join MusicXML fragments into one score by appending each part's measures in order.
+
+    Raises ValueError if the fragments do not have the same number of parts.
     """
-    Convert MusicXML to MIDI using music21 and play the MIDI file.
+    merged = None
+    for xml_path in xml_paths:
+        score = converter.parse(xml_path)
+        if merged is None:
+            merged = score
+            continue
+        if len(score.parts) != len(merged.parts):
+            raise ValueError(f"{os.path.basename(xml_path)} has {len(score.parts)} parts, expected {len(merged.parts)}")
+        for merged_part, part in zip(merged.parts, score.parts):
+            for measure in part.getElementsByClass(stream.Measure):
+                merged_part.append(measure)
+    return merged
+
+def run_omr_parallel(image_path, output_xml_path="output.musicxml"):
+    """
+    Like run_omr, but runs one oemer process per staff system at once and joins the results.
+    """
+    img = cv2.imread(image_path, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        print(f"⚠️ OMR failed: could not read {image_path}")
+        return None
+    crops = _split_staves(img)
+    if len(crops) < 2:
+        return run_omr(image_path, output_xml_path)
+    print(f"🎼 Running OMR on {len(crops)} staff systems in parallel...")
+    with tempfile.TemporaryDirectory() as work_dir:
+        crop_paths = []
+        for i, crop in enumerate(crops):
+            crop_path = os.path.join(work_dir, f"system_{i:03d}.png")
+            cv2.imwrite(crop_path, crop, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+            crop_paths.append(crop_path)
+
+        # oemer runs as a subprocess, so threads are enough to drive it
+        with ThreadPoolExecutor(max_workers=min(MAX_OMR_WORKERS, len(crop_paths))) as executor:
+            xml_paths = list(executor.map(_run_single_oemer, crop_paths))
+        # A missing or mismatched system would silently drop music, so read the whole page instead
+        try:
+            if not all(xml_paths):
+                raise ValueError("not every staff system could be read")
+            _merge_scores(xml_paths).write("musicxml", fp=output_xml_path)
+        except Exception as e:
+            print(f"⚠️ Could not join staff systems ({e}); running OMR on the whole page")
+            return run_omr(image_path, output_xml_path)
+    print(f"✅ MusicXML generated: {output_xml_path}")
+    return output_xml_path
+
+def convert_to_midi(musicxml_file, midi_file="output.mid"):
+    """
+    Convert MusicXML to MIDI using music21. Returns midi_file, or None on failure.
     """
     try:
-        score = converter.parse(musicxml_file)
-        score.write('midi', fp=midi_file)
+        score = cached_parse(musicxml_file)
+        write_midi(score, midi_file)
         print(f"🎼 MIDI generated: {midi_file}")
-        pygame.mixer.init()
+    except Exception as e:
+        print(f"⚠️ Error in MIDI conversion: {e}")
+        return None
+    return midi_file
+
+def play_midi_file(midi_file):
+    """
+    Play a MIDI file with pygame, blocking until it finishes.
+    """
+    try:
+        ensure_mixer()
         pygame.mixer.music.load(midi_file)
         pygame.mixer.music.play()
         while pygame.mixer.music.get_busy():
-            pygame.time.Clock().tick(10)
+            time.sleep(0.1)
     except Exception as e:
         print(f"⚠️ Error in MIDI playback: {e}")
 
+# Function to convert MusicXML to MIDI and play it
+def convert_and_play_music(musicxml_file, midi_file="output.mid"):
+    """
+    Convert MusicXML to MIDI using music21 and play the MIDI file.
+    """
+    if convert_to_midi(musicxml_file, midi_file):
+        play_midi_file(midi_file)
+
 # Main function to process the sheet music and generate audio
-def process_and_play_sheet_music(image_path):
+def process_and_play_sheet_music(image_path, parallel=False):
     """
     Complete flow: Capture image, preprocess, OMR, convert to MIDI, and play.
+    With parallel=True, OMR runs on each staff system concurrently.
     """
     # Step 1: Enhance and clean the image
     enhanced_image_path = enhance_scanned_image(image_path)
 
     # Step 2: Run OMR to generate MusicXML
-    musicxml_path = run_omr(enhanced_image_path)
+    try:
+        musicxml_path = (run_omr_parallel if parallel else run_omr)(enhanced_image_path)
+    finally:
+        os.remove(enhanced_image_path)
     if not musicxml_path:
         return "Error during OMR processing."
 
     # Step 3: Convert MusicXML to MIDI
     convert_and_play_music(musicxml_path)
 
+def _omr_worker(image_paths, parallel, xml_queue):
+    """Enhance and OMR each image in turn, queueing (index, MusicXML path) and then None."""
+    try:
+        for i, image_path in enumerate(image_paths):
+            # A bad page is skipped rather than ending the whole run
+            try:
+                enhanced_image_path = enhance_scanned_image(image_path)
+                try:
+                    musicxml_path = (run_omr_parallel if parallel else run_omr)(enhanced_image_path, f"output_{i}.musicxml")
+                finally:
+                    os.remove(enhanced_image_path)
+            except Exception as e:
+                print(f"⚠️ Skipping {image_path}: {e}")
+                continue
+            if musicxml_path:
+                xml_queue.put((i, musicxml_path))
+    finally:
+        # Always sent, or the consumers would wait forever
+        xml_queue.put(None)
+
+def _midi_worker(xml_queue, midi_queue):
+    """Convert each queued MusicXML file to MIDI, queueing the MIDI paths and then None."""
+    try:
+        while (item := xml_queue.get()) is not None:
+            i, musicxml_path = item
+            midi_file = convert_to_midi(musicxml_path, f"output_{i}.mid")
+            if midi_file:
+                midi_queue.put(midi_file)
+    finally:
+        midi_queue.put(None)
+
+def process_and_play_sheets(image_paths, parallel=False):
+    """
+    Like process_and_play_sheet_music for several pages: while one page plays,
+    the next ones are already going through OMR and MIDI conversion.
+    """
+    xml_queue = queue.Queue()
+    midi_queue = queue.Queue()
+    workers = [
+        threading.Thread(target=_omr_worker, args=(image_paths, parallel, xml_queue), daemon=True),
+        threading.Thread(target=_midi_worker, args=(xml_queue, midi_queue), daemon=True),
+    ]
+    for worker in workers:
+        worker.start()
+    # Playback stays on the calling thread
+    while (midi_file := midi_queue.get()) is not None:
+        play_midi_file(midi_file)
+    for worker in workers:
+        worker.join()
+
 # If running as a standalone script
 if __name__ == "__main__":
-    # Capture and process an image (this can be skipped in a web app)
-    image_path = capture_sheet_music_image()  # In a web app, this would come as a file upload
-    process_and_play_sheet_music(image_path)
+    parser = argparse.ArgumentParser(description="Turn sheet music images, or a webcam capture, into audio and play it.")
+    parser.add_argument("images", nargs="*", help="sheet music images to play in order; captured from the webcam if omitted")
+    parser.add_argument("--parallel", action="store_true", help="run OMR on each staff system in parallel")
+    args = parser.parse_args()
+
+    if args.images:
+        process_and_play_sheets(args.images, parallel=args.parallel)
+    else:
+        # Capture and process an image (this can be skipped in a web app)
+        image_path = capture_sheet_music_image(UPLOAD_FOLDER)  # In a web app, this would come as a file upload
+        if image_path:
+            process_and_play_sheet_music(image_path, parallel=args.parallel)
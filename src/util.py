@@ -0,0 +1,35 @@
+import logging
+import os
+import tempfile
+import aiofiles.os
+
+logger = logging.getLogger(__name__)
+
+# Intermediate files (uploads, MusicXML, MIDI, MP3) live here. Set PIPELINE_TMP to a
+# RAM-backed directory such as /dev/shm/sm2af to avoid disk write-back for files that exist
+# only for one request, but only where it is large enough for every slot's files:
+# containers get a 64 MB /dev/shm by default.
+TMP_DIR = os.environ.get("PIPELINE_TMP", os.path.join(tempfile.gettempdir(), "sm2af"))
+os.makedirs(TMP_DIR, exist_ok=True)
+
+
+def cleanup_files(file_paths):
+    """Remove the given files, logging instead of raising on failure."""
+    for file_path in file_paths:
+        try:
+            if file_path and os.path.exists(file_path):
+                os.remove(file_path)
+                logger.info("Removed: %s", file_path)
+        except Exception as e:
+            logger.warning("Could not delete %s: %s", file_path, e)
+
+
+async def remove_files(file_paths):
+    """Like cleanup_files, but without blocking the event loop."""
+    for file_path in file_paths:
+        try:
+            if file_path and await aiofiles.os.path.exists(file_path):
+                await aiofiles.os.remove(file_path)
+                logger.info("Removed: %s", file_path)
+        except Exception as e:
+            logger.warning("Could not delete %s: %s", file_path, e)
@@ -0,0 +1,84 @@
+"""Tests for the --parallel OMR helpers: cutting a page into staff systems and joining the results."""
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("cv2")
+pytest.importorskip("pygame")
+pytest.importorskip("music21")
+pytest.importorskip("symusic")
+
+from music21 import note, stream
+from src.sheet_music_processsor import _count_staves, _merge_scores, _split_staves
+
+HEIGHT = 1000
+WIDTH = 800
+LINE_SPACING = 10
+STAFF_HEIGHT = 4 * LINE_SPACING + 1
+MARGIN = int(HEIGHT * 0.02) // 2
+
+
+def _page(staff_tops, barlines=()):
+    """A white page with a five-line staff at each top row, and barlines as (top, bottom) rows."""
+    page = np.full((HEIGHT, WIDTH), 255, dtype=np.uint8)
+    for top in staff_tops:
+        page[top:top + STAFF_HEIGHT:LINE_SPACING] = 0
+    for top, bottom in barlines:
+        page[top:bottom, WIDTH // 2] = 0
+    return page
+
+
+def test_separate_systems_are_split_top_to_bottom():
+    page = _page([100, 500])
+    crops = _split_staves(page)
+
+    assert len(crops) == 2
+    assert [_count_staves(crop) for crop in crops] == [1, 1]
+    # Half of the minimum gap is kept on either side of each system
+    assert np.array_equal(crops[0], page[100 - MARGIN:100 + STAFF_HEIGHT + MARGIN])
+    assert np.array_equal(crops[1], page[500 - MARGIN:500 + STAFF_HEIGHT + MARGIN])
+
+
+def test_grand_staff_joined_by_barline_stays_together():
+    page = _page([100, 200, 500, 600], barlines=[(100, 200 + STAFF_HEIGHT), (500, 600 + STAFF_HEIGHT)])
+    crops = _split_staves(page)
+
+    assert len(crops) == 2
+    assert [_count_staves(crop) for crop in crops] == [2, 2]
+
+
+def test_inconsistent_staff_counts_keep_page_whole():
+    page = _page([100, 200, 500], barlines=[(100, 200 + STAFF_HEIGHT)])
+    crops = _split_staves(page)
+
+    assert len(crops) == 1
+    assert crops[0] is page
+
+
+def _write_fragment(path, *pitches):
+    """Write a score with one part per pitch, each holding a single whole-note measure."""
+    parts = []
+    for pitch in pitches:
+        measure = stream.Measure([note.Note(pitch, quarterLength=4)])
+        parts.append(stream.Part([measure]))
+    stream.Score(parts).write("musicxml", fp=str(path))
+    return str(path)
+
+
+def test_merge_appends_each_part_in_band_order(tmp_path):
+    first = _write_fragment(tmp_path / "system_000.musicxml", "C5", "C3")
+    second = _write_fragment(tmp_path / "system_001.musicxml", "D5", "D3")
+    merged = _merge_scores([first, second])
+
+    assert [[n.nameWithOctave for n in part.flatten().notes] for part in merged.parts] == [
+        ["C5", "D5"],
+        ["C3", "D3"],
+    ]
+
+
+def test_merge_rejects_mismatched_part_counts(tmp_path):
+    first = _write_fragment(tmp_path / "system_000.musicxml", "C5", "C3")
+    second = _write_fragment(tmp_path / "system_001.musicxml", "D5")
+
+    with pytest.raises(ValueError):
+        _merge_scores([first, second])
@@ -0,0 +1,77 @@
+"""Tests for write_midi: the MIDI it writes is read back with symusic and checked note by note."""
+
+import pytest
+
+music21 = pytest.importorskip("music21")
+symusic = pytest.importorskip("symusic")
+pytest.importorskip("cv2")
+
+from music21 import chord, note, stream, tempo, tie
+from src.omr_core import DEFAULT_VELOCITY, MIDI_TICKS_PER_QUARTER, write_midi
+
+Q = MIDI_TICKS_PER_QUARTER
+
+
+def _write_and_read(score, tmp_path):
+    midi_file = tmp_path / "out.mid"
+    write_midi(score, str(midi_file))
+    return symusic.Score(str(midi_file))
+
+
+def _notes(track):
+    return sorted((n.time, n.duration, n.pitch) for n in track.notes)
+
+
+def _part():
+    """C4, a grace note, a C major chord, then D4 tied across two beats."""
+    part = stream.Part()
+    part.append(note.Note("C4", quarterLength=1))
+    part.append(note.Note("B3").getGrace())
+    part.append(chord.Chord(["C4", "E4", "G4"], quarterLength=2))
+    first = note.Note("D4", quarterLength=1)
+    first.tie = tie.Tie("start")
+    second = note.Note("D4", quarterLength=1)
+    second.tie = tie.Tie("stop")
+    part.append([first, second])
+    return part
+
+
+def test_notes_chords_ties_and_grace_notes(tmp_path):
+    midi = _write_and_read(stream.Score([_part()]), tmp_path)
+
+    assert len(midi.tracks) == 1
+    assert _notes(midi.tracks[0]) == [
+        (0, Q, 60),
+        # Every chord tone starts and ends together
+        (Q, 2 * Q, 60),
+        (Q, 2 * Q, 64),
+        (Q, 2 * Q, 67),
+        # Tied notes sound once for their combined length
+        (3 * Q, 2 * Q, 62),
+    ]  # The grace note B3 has no written length and is left out
+    assert {n.velocity for n in midi.tracks[0].notes} == {DEFAULT_VELOCITY}
+
+
+def test_tempo_changes_keep_their_offsets(tmp_path):
+    part = _part()
+    part.insert(0, tempo.MetronomeMark(number=120))
+    part.insert(3, tempo.MetronomeMark(number=60))
+    midi = _write_and_read(stream.Score([part]), tmp_path)
+
+    tempos = [(t.time, t.qpm) for t in midi.tempos]
+    assert [time for time, _ in tempos] == [0, 3 * Q]
+    assert [qpm for _, qpm in tempos] == pytest.approx([120, 60], abs=0.01)
+
+
+def test_one_track_per_part(tmp_path):
+    upper = stream.Part([note.Note("E5", quarterLength=4)])
+    lower = stream.Part([note.Note("C3", quarterLength=4)])
+    midi = _write_and_read(stream.Score([upper, lower]), tmp_path)
+
+    assert [_notes(track) for track in midi.tracks] == [[(0, 4 * Q, 76)], [(0, 4 * Q, 48)]]
+
+
+def test_stream_without_parts(tmp_path):
+    midi = _write_and_read(stream.Stream([note.Note("A4", quarterLength=0.5)]), tmp_path)
+
+    assert [_notes(track) for track in midi.tracks] == [[(0, Q // 2, 69)]]